@@ -0,0 +1,185 @@
+# BIPS: Benchmarking the scheduler on synthetic problems
+# See the benchmark_scheduler command for use.
+
+import datetime
+import gc
+import math
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+from django.db import connection
+
+from .models import Applicant, Application, BusyTime, Interviewer, InterviewSlot, Job, Room
+from .problem import Problem
+from .engines import ENGINES
+from .scheduler import assert_one_interview_slot_per_room_per_time
+
+PHASES = ("load", "pass_1", "pass_2", "improve", "validate", "save")
+
+
+def generate_problem(applicants, rooms=None, days=8, first_date=datetime.date(2022, 2, 1),
+    first_time=datetime.time(9, 15), last_time=datetime.time(19, 45), slot_minutes=45,
+    jobs=None, interviewers=None, pool_sizes=(3, 3, 4), max_jobs_per_applicant=3,
+    applicant_busy_times=2, interviewer_busy_times=4, seed=0):
+    """
+    Inserts a reproducible synthetic problem into the database, shaped like the UKA intakes:
+    interview slots for each room and day between first_time and last_time (like the
+    generate_slots command), jobs with random priority 1, 2 and 3
+    interviewer pools of pool_sizes, and on average applicant_busy_times and
+    interviewer_busy_times busy times of one to four hours per person. By default there are
+    20 % more slots than applicants, a job per 20 applicants and an interviewer per 10.
+    """
+    rng = random.Random(seed)
+    slot_length = datetime.timedelta(minutes=slot_minutes)
+    slots_per_day = (datetime.datetime.combine(first_date, last_time)
+        - datetime.datetime.combine(first_date, first_time)) // slot_length + 1
+    if rooms is None:
+        rooms = math.ceil(1.2 * applicants / (days * slots_per_day))
+    if jobs is None:
+        jobs = max(1, applicants // 20)
+    if interviewers is None:
+        interviewers = max(sum(pool_sizes), applicants // 10)
+
+    Room.objects.bulk_create([Room(name=f"Room {i}") for i in range(rooms)])
+    room_pks = list(Room.objects.order_by('id').values_list('id', flat=True))
+    slots = []
+    for room_pk in room_pks:
+        for day in range(days):
+            start_time = datetime.datetime.combine(first_date + datetime.timedelta(days=day),
+                first_time)
+            for _ in range(slots_per_day):
+                slots.append(InterviewSlot(room_id=room_pk, start_time=start_time,
+                    end_time=start_time + slot_length))
+                start_time += slot_length
+    InterviewSlot.objects.bulk_create(slots, batch_size=1000)
+
+    Interviewer.objects.bulk_create(
+        [Interviewer(name=f"Interviewer {i}") for i in range(interviewers)], batch_size=1000)
+    interviewer_pks = list(Interviewer.objects.order_by('id').values_list('id', flat=True))
+    Job.objects.bulk_create([Job(title=f"Job {i}", include_priority_1_interviewer=(i % 5 == 0))
+        for i in range(jobs)], batch_size=1000)
+    job_pks = list(Job.objects.order_by('id').values_list('id', flat=True))
+    for priority, field in enumerate((Job.possible_interviewers_1, Job.possible_interviewers_2,
+        Job.possible_interviewers_3)):
+        field.through.objects.bulk_create([field.through(job_id=job_pk,
+            interviewer_id=interviewer_pk) for job_pk in job_pks
+            for interviewer_pk in rng.sample(interviewer_pks, pool_sizes[priority])],
+            batch_size=1000)
+
+    Applicant.objects.bulk_create([Applicant(name=f"Applicant {i}") for i in range(applicants)],
+        batch_size=1000)
+    applicant_pks = list(Applicant.objects.order_by('id').values_list('id', flat=True))
+    Application.objects.bulk_create([Application(applicant_id=applicant_pk, job_id=job_pk)
+        for applicant_pk in applicant_pks
+        for job_pk in rng.sample(job_pks, rng.randint(1, min(max_jobs_per_applicant, jobs)))],
+        batch_size=1000)
+
+    busy_times = []
+    for person_field, pks, busy_times_per_person in (
+        ('applicant_id', applicant_pks, applicant_busy_times),
+        ('interviewer_id', interviewer_pks, interviewer_busy_times)):
+        for pk in pks:
+            # Averages busy_times_per_person, which need not be a whole number
+            for _ in range(round(rng.uniform(0, 2 * busy_times_per_person))):
+                begin = (datetime.datetime.combine(first_date, first_time)
+                    + datetime.timedelta(days=rng.randrange(days), minutes=rng.randrange(0,
+                    slots_per_day * slot_minutes, 15)))
+                busy_times.append(BusyTime(**{person_field: pk}, begin=begin,
+                    end=begin + datetime.timedelta(hours=rng.randint(1, 4))))
+    BusyTime.objects.bulk_create(busy_times, batch_size=1000)
+    return {"applicants": applicants, "rooms": rooms, "days": days,
+        "slots": len(slots), "slot_minutes": slot_minutes, "jobs": jobs,
+        "interviewers": interviewers, "pool_sizes": list(pool_sizes),
+        "applications": Application.objects.count(), "busy_times": len(busy_times),
+        "seed": seed}
+
+
+class PhaseMeasurement:
+    # Wall time, memory, database queries and garbage collections of one phase
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.queries = 0
+
+    def count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def measure(self):
+        gc_collections = gc.get_stats()[0]['collections']
+        if self.trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        with connection.execute_wrapper(self.count_query):
+            yield self
+        self.wall_s = time.perf_counter() - started
+        self.traced_peak_mb = None
+        if self.trace_memory:
+            self.traced_peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+        # Generation 0 is collected each time gc.get_threshold()[0] more container objects
+        # have been allocated than freed, so the collection rate tracks the allocation rate
+        self.gc_collections = gc.get_stats()[0]['collections'] - gc_collections
+
+    def as_dict(self):
+        return {"wall_s": round(self.wall_s, 4), "queries": self.queries,
+            "traced_peak_mb": (None if self.traced_peak_mb is None
+                else round(self.traced_peak_mb, 2)),
+            "peak_rss_mb": round(peak_rss_mb(), 2), "gc_collections": self.gc_collections,
+            "gc_collections_per_s": round(self.gc_collections / max(self.wall_s, 1e-9), 1)}
+
+
+def run_benchmark(seed=0, trace_memory=False, engine="greedy", improve_seconds=0):
+    """
+    Schedules the problem in the database with the engine (see ENGINES) and measures each
+    phase: loading the problem, the first and second scheduling pass, improving the schedule
+    for at most improve_seconds, validation and saving. Returns the measurements and the
+    scheduling result as a dict.
+    """
+    measurements = {phase: PhaseMeasurement(trace_memory) for phase in PHASES}
+    with measurements["load"].measure():
+        assert_one_interview_slot_per_room_per_time()
+        scheduler = ENGINES[engine](seed, Problem.from_database())
+    with measurements["pass_1"].measure():
+        scheduler.first_pass()
+    allocated_after_pass_1 = len(scheduler.interviews)
+    with measurements["pass_2"].measure():
+        scheduler.second_pass()
+    with measurements["improve"].measure():
+        if improve_seconds > 0:
+            scheduler.improve(improve_seconds)
+    with measurements["validate"].measure():
+        scheduler.validate()
+    with measurements["save"].measure():
+        rows_written, _ = scheduler.save_scheduled_interviews()
+    return {"phases": {phase: measurement.as_dict()
+        for phase, measurement in measurements.items()},
+        "engine": engine,
+        "total_wall_s": round(sum(m.wall_s for m in measurements.values()), 4),
+        "applicants": scheduler.problem.num_applicants,
+        "allocated_after_pass_1": allocated_after_pass_1,
+        "allocated": len(scheduler.interviews), "rows_written": rows_written,
+        "scheduler_stats": scheduler.stats.as_dict()}
+
+
+def environment():
+    # Information for comparing benchmark results across commits and machines
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "python": sys.version.split()[0], "numpy": np.__version__,
+        "database": connection.vendor}
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss / (2**20 if sys.platform == "darwin" else 2**10)
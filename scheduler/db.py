@@ -0,0 +1,30 @@
+# BIPS: Database helpers shared by the management commands
+
+from django.db import connection
+from django.db.models import Prefetch
+
+from .models import Application, Interviewer, InterviewSlot
+
+
+def create_with_pks(model, objs):
+    # Inserts new model instances so that their primary keys are set. The primary keys of bulk
+    # inserted rows are only set on some databases, so elsewhere each instance is saved
+    if connection.features.can_return_rows_from_bulk_insert:
+        model.objects.bulk_create(objs)
+    else:
+        for obj in objs:
+            obj.save()
+
+
+def scheduled_interview_slots():
+    # Returns the interview slots with applications, with their room selected and their
+    # interviewers (by name) and applications (with applicants and jobs) prefetched, which
+    # takes one query for the slots and one each for the two prefetches
+    applications = Application.objects.select_related('applicant', 'job').order_by('id')
+    scheduled = Application.objects.exclude(interview_slot=None).values('interview_slot')
+    return (InterviewSlot.objects
+        .filter(pk__in=scheduled)
+        .select_related('room')
+        .prefetch_related(
+            Prefetch('interviewers', queryset=Interviewer.objects.order_by('name', 'id')),
+            Prefetch('application_set', queryset=applications)))
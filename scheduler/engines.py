@@ -0,0 +1,9 @@
+# BIPS: The scheduling engines, by name, for the --engine option of the management commands
+
+from .matching import MatchingScheduler
+from .scheduler import Scheduler
+
+ENGINES = {
+    "greedy": Scheduler,
+    "matching": MatchingScheduler,
+}
@@ -0,0 +1,193 @@
+# BIPS: Improving a schedule by local search
+# After scheduling, the interviews are changed one move at a time, keeping the schedule valid,
+# to get fewer interviews without priority 1 interviewers and a more even number of
+# interviews per interviewer, without moving interviews to later slots. See Scheduler.improve.
+
+import random
+import time
+
+# The cost of an applied job without a priority 1 interviewer in the interview, in the units
+# of the interviewer load cost (the sum of the squared number of interviews per interviewer)
+MISSING_PRIORITY_1_COST = 1000
+
+
+class Improver:
+    """
+    Local search over the interviews of a Scheduler. Each move replaces an interviewer, moves
+    an interview to an earlier free slot or swaps the slots of two interviews, and is kept if
+    the schedule stays valid and, for interviewer replacements, its cost goes down. Slot moves
+    don't change the cost, but only ever make the set of taken slots earlier, so the early
+    interview slots stay filled up first. The change in cost of a move is computed from the
+    interviews it touches only, before checking that the move is valid.
+    """
+
+    def __init__(self, scheduler, seed=None):
+        self.scheduler = scheduler
+        self.random = random.Random(scheduler.seed if seed is None else seed)
+        self.load = [0] * len(scheduler.problem.interviewer_pks)
+        for interview in scheduler.interviews:
+            for interviewer in interview.interviewers:
+                self.load[interviewer] += 1
+        # The interviewers who can interview each applicant, from the pools of the applied jobs
+        self.applicant_interviewers = {}
+        self.moves_evaluated = 0
+        self.moves_applied = 0
+
+    def cost(self):
+        return (sum(load * load for load in self.load)
+            + sum(self.missing_priority_1_cost(interview.applicant, interview.interviewers)
+            for interview in self.scheduler.interviews))
+
+    def missing_priority_1_cost(self, applicant, interviewers):
+        job_pools = self.scheduler.job_pools
+        return MISSING_PRIORITY_1_COST * sum(job_pools[job].priority_1.isdisjoint(interviewers)
+            for job in self.scheduler.applied_jobs[applicant])
+
+    def interviewers_are_valid(self, applicant, interviewers):
+        # At least one interviewer from each applied job, and a priority 1 interviewer for the
+        # jobs that require one
+        for job in self.scheduler.applied_jobs[applicant]:
+            pool = self.scheduler.job_pools[job]
+            if pool.all.isdisjoint(interviewers):
+                return False
+            if (self.scheduler.problem.job_include_priority_1[job]
+                and pool.priority_1.isdisjoint(interviewers)):
+                return False
+        return True
+
+    def candidate_interviewers(self, applicant):
+        candidates = self.applicant_interviewers.get(applicant)
+        if candidates is None:
+            candidates = tuple(sorted(frozenset().union(*(self.scheduler.job_pools[job].all
+                for job in self.scheduler.applied_jobs[applicant]))))
+            self.applicant_interviewers[applicant] = candidates
+        return candidates
+
+    def replace_interviewer(self, interview, old_interviewer, new_interviewer):
+        # Replaces old_interviewer by new_interviewer if that makes the schedule cheaper and
+        # keeps it valid. Returns True if the interviewer was replaced.
+        self.moves_evaluated += 1
+        if new_interviewer in interview.interviewers:
+            return False
+        interviewers = interview.interviewers - {old_interviewer} | {new_interviewer}
+        # Moving one interview from old_interviewer to new_interviewer changes the sum of
+        # squared loads by 2 * (new load - old load + 1)
+        delta = (2 * (self.load[new_interviewer] - self.load[old_interviewer] + 1)
+            + self.missing_priority_1_cost(interview.applicant, interviewers)
+            - self.missing_priority_1_cost(interview.applicant, interview.interviewers))
+        if delta >= 0 or not self.interviewers_are_valid(interview.applicant, interviewers):
+            return False
+        scheduler = self.scheduler
+        scheduler.release_interviewer(old_interviewer, interview.interview_slot)
+        if not scheduler.interviewer_can_take(new_interviewer, interview.interview_slot):
+            scheduler.book_interviewer(old_interviewer, interview.interview_slot)
+            return False
+        scheduler.book_interviewer(new_interviewer, interview.interview_slot)
+        interview.interviewers = interviewers
+        self.load[old_interviewer] -= 1
+        self.load[new_interviewer] += 1
+        self.moves_applied += 1
+        return True
+
+    def move_interview(self, interview, interview_slot):
+        # Moves the interview to a free slot if it is earlier in slot order and the applicant
+        # and the interviewers are available. The cost does not change, but other interviewers
+        # may become available for replacements. Returns True if the interview was moved.
+        self.moves_evaluated += 1
+        scheduler = self.scheduler
+        if (interview_slot >= interview.interview_slot
+            or not scheduler.slot_is_free[interview_slot]
+            or not scheduler.applicant_is_available(interview.applicant, interview_slot)):
+            return False
+        return self.relocate([interview], [interview_slot])
+
+    def swap_interviews(self, first, second):
+        # Swaps the slots of two interviews if the applicants and the interviewers are
+        # available. Returns True if the slots were swapped.
+        self.moves_evaluated += 1
+        scheduler = self.scheduler
+        if (first is second
+            or not scheduler.applicant_is_available(first.applicant, second.interview_slot)
+            or not scheduler.applicant_is_available(second.applicant, first.interview_slot)):
+            return False
+        return self.relocate([first, second], [second.interview_slot, first.interview_slot])
+
+    def relocate(self, interviews, interview_slots):
+        # Moves each interview to the corresponding slot if all interviewers are available
+        # there, and otherwise leaves the interviews unchanged. Returns True if they were moved.
+        scheduler = self.scheduler
+        for interview in interviews:
+            for interviewer in interview.interviewers:
+                scheduler.release_interviewer(interviewer, interview.interview_slot)
+        booked = []
+        for interview, interview_slot in zip(interviews, interview_slots):
+            for interviewer in interview.interviewers:
+                if not scheduler.interviewer_can_take(interviewer, interview_slot):
+                    for booked_interviewer, booked_slot in booked:
+                        scheduler.release_interviewer(booked_interviewer, booked_slot)
+                    for unmoved in interviews:
+                        for unmoved_interviewer in unmoved.interviewers:
+                            scheduler.book_interviewer(unmoved_interviewer,
+                                unmoved.interview_slot)
+                    return False
+                scheduler.book_interviewer(interviewer, interview_slot)
+                booked.append((interviewer, interview_slot))
+        indices = [scheduler.slot_index.pop(interview.interview_slot) for interview in interviews]
+        for interview in interviews:
+            scheduler.slot_is_free[interview.interview_slot] = True
+            del scheduler.slot_interview[interview.interview_slot]
+        for interview, interview_slot, index in zip(interviews, interview_slots, indices):
+            interview.interview_slot = interview_slot
+            scheduler.slot_is_free[interview_slot] = False
+            scheduler.slot_interview[interview_slot] = interview
+            scheduler.slot_index[interview_slot] = index
+        self.moves_applied += 1
+        return True
+
+    def try_replacements(self, interview):
+        # Tries to replace the interviewers of the interview, most loaded first, by the least
+        # loaded candidates. Returns True if an interviewer was replaced.
+        candidates = sorted(self.candidate_interviewers(interview.applicant),
+            key=self.load.__getitem__)
+        for old_interviewer in sorted(interview.interviewers, key=self.load.__getitem__,
+            reverse=True):
+            for new_interviewer in candidates:
+                if self.replace_interviewer(interview, old_interviewer, new_interviewer):
+                    return True
+        return False
+
+    def run(self, seconds):
+        """
+        Makes random moves for at most seconds, and stops early when no interviewer of any
+        interview can be replaced to make the schedule cheaper.
+        """
+        scheduler = self.scheduler
+        interviews = scheduler.interviews
+        if not interviews:
+            return
+        deadline = time.perf_counter() + seconds
+        # Random moves without an improvement before looking for one among all interviews
+        patience = 20 * len(interviews)
+        moves_without_improvement = 0
+        while time.perf_counter() < deadline:
+            for _ in range(256):
+                interview = interviews[self.random.randrange(len(interviews))]
+                move = self.random.random()
+                if move < 0.8:
+                    old_interviewer = self.random.choice(tuple(interview.interviewers))
+                    new_interviewer = self.random.choice(
+                        self.candidate_interviewers(interview.applicant))
+                    if self.replace_interviewer(interview, old_interviewer, new_interviewer):
+                        moves_without_improvement = 0
+                        continue
+                elif move < 0.9:
+                    self.move_interview(interview,
+                        self.random.randrange(scheduler.problem.num_slots))
+                else:
+                    self.swap_interviews(interview,
+                        interviews[self.random.randrange(len(interviews))])
+                moves_without_improvement += 1
+            if moves_without_improvement >= patience:
+                if not any([self.try_replacements(interview) for interview in interviews]):
+                    break
+                moves_without_improvement = 0
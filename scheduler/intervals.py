@@ -0,0 +1,137 @@
+# BIPS: Interval structures used by the scheduler for availability checks
+# Times are given in minutes, see problem.py.
+
+import heapq
+import math
+
+from sortedcontainers import SortedKeyList, SortedList
+
+# Busy times shorter than 2**MIN_LENGTH_CLASS minutes (about four hours) are kept in one bucket
+MIN_LENGTH_CLASS = 8
+
+
+class BusyTimeIndex:
+    """
+    The busy times of one person, as (start, end, room) tuples. room is None for busy times
+    that are not interviews. The busy times are bucketed by length class (see length_class),
+    and each bucket is sorted by start time. Overlap queries only look at the busy times of
+    each bucket starting within its longest busy time of the queried interval, so a long busy
+    time such as a full day doesn't slow down queries among the short ones.
+    """
+
+    def __init__(self, busy_times=()):
+        self.buckets = {}
+        # The longest busy time added to each bucket, an upper bound after removals
+        self.longest = {}
+        for busy_time in busy_times:
+            self.add(busy_time)
+
+    def __iter__(self):
+        # In order of start time
+        return heapq.merge(*self.buckets.values(), key=busy_time_order)
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self.buckets.values())
+
+    def add(self, busy_time):
+        length = busy_time[1] - busy_time[0]
+        bucket_class = length_class(length)
+        bucket = self.buckets.get(bucket_class)
+        if bucket is None:
+            bucket = self.buckets[bucket_class] = SortedKeyList(key=busy_time_order)
+        bucket.add(busy_time)
+        self.longest[bucket_class] = max(self.longest.get(bucket_class, 0), length)
+
+    def remove(self, busy_time):
+        bucket_class = length_class(busy_time[1] - busy_time[0])
+        bucket = self.buckets[bucket_class]
+        bucket.remove(busy_time)
+        # Empty buckets are not queried
+        if not bucket:
+            del self.buckets[bucket_class]
+            del self.longest[bucket_class]
+
+    def overlapping(self, start, end, padding=0):
+        # Busy times that may overlap [start - padding, end + padding)
+        max_key = (end + padding,)
+        if len(self.buckets) == 1:
+            # Usually all busy times are short
+            (bucket_class, bucket), = self.buckets.items()
+            return bucket.irange_key(min_key=(start - padding - self.longest[bucket_class],),
+                max_key=max_key, inclusive=(True, False))
+        return [busy_time for bucket_class, bucket in self.buckets.items()
+            for busy_time in bucket.irange_key(
+            min_key=(start - padding - self.longest[bucket_class],), max_key=max_key,
+            inclusive=(True, False))]
+
+
+class WorkRuns:
+    """
+    The interviews of one interviewer merged into continuous work runs. Interviews with less
+    than break_length between them belong to the same run. Runs are kept sorted and disjoint,
+    so the runs an interval would be merged with are always neighbours of its position.
+    """
+
+    def __init__(self, break_length, work_times=()):
+        self.break_length = break_length
+        self.work_times = SortedList()
+        self.runs = SortedList()
+        for start, end in work_times:
+            self.add(start, end)
+
+    def __iter__(self):
+        return iter(self.runs)
+
+    def joined_runs(self, start, end):
+        # The runs that [start, end) would be merged with
+        joined = []
+        i = self.runs.bisect_left((end + self.break_length,)) - 1
+        while i >= 0 and self.runs[i][1] + self.break_length > start:
+            joined.append(self.runs[i])
+            i -= 1
+        return joined
+
+    def continuous_work_with(self, start, end):
+        # Length of the continuous work run containing [start, end) if it was added
+        joined = self.joined_runs(start, end)
+        run_start = min([start] + [run[0] for run in joined])
+        run_end = max([end] + [run[1] for run in joined])
+        return run_end - run_start
+
+    def run_at(self, start):
+        # The run containing an interview starting at start
+        return self.runs[self.runs.bisect_right((start, math.inf)) - 1]
+
+    def add(self, start, end):
+        self.work_times.add((start, end))
+        joined = self.joined_runs(start, end)
+        for run in joined:
+            self.runs.remove(run)
+        self.runs.add((min([start] + [run[0] for run in joined]),
+            max([end] + [run[1] for run in joined])))
+
+    def remove(self, start, end):
+        self.work_times.remove((start, end))
+        run = self.run_at(start)
+        self.runs.remove(run)
+        # The remaining interviews of the run may now be split into several runs
+        run_start = run_end = None
+        for work_start, work_end in self.work_times.irange((run[0],), (run[1],)):
+            if run_end is None or work_start >= run_end + self.break_length:
+                if run_end is not None:
+                    self.runs.add((run_start, run_end))
+                run_start, run_end = work_start, work_end
+            else:
+                run_end = max(run_end, work_end)
+        if run_end is not None:
+            self.runs.add((run_start, run_end))
+
+
+def length_class(length):
+    # Longer busy times are bucketed by powers of two, so the busy times of a bucket are at
+    # least half as long as its longest
+    return max(length.bit_length(), MIN_LENGTH_CLASS)
+
+def busy_time_order(busy_time):
+    # Rooms can't be compared, so only sort by time
+    return (busy_time[0], busy_time[1])
@@ -0,0 +1,38 @@
+# -*- coding: utf8 -*-
+
+# A management command for saving a schedule plan to the database.
+# Run with python manage.py apply_plan plan.json in root folder.
+# The plan is written by schedule_interviews --plan-out. It is checked against the current
+# database, so that interviews for applications scheduled or withdrawn since, slots that have
+# been taken and broken scheduling rules are reported, and then saved in one transaction. With
+# --dry-run, the plan is only checked.
+
+import time
+
+from django.core import management
+
+from scheduler.plan import apply_plan, read_plan
+
+
+class Command(management.BaseCommand):
+    help = 'Save the interviews of a plan written by schedule_interviews --plan-out'
+
+    def add_arguments(self, parser):
+        parser.add_argument('plan_file', help="Plan file written by schedule_interviews")
+        parser.add_argument('--dry-run', action='store_true',
+            help="Check the plan against the database without saving it")
+        parser.add_argument('--batch-size', type=int, default=500,
+            help="Number of rows written per query (default: 500)")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            plan = read_plan(options['plan_file'])
+            rows_written = apply_plan(plan, options['batch_size'], options['dry_run'])
+        except ValueError as error:
+            raise management.CommandError(str(error))
+        if options['dry_run']:
+            print(f"The plan with {len(plan['interviews'])} interviews is valid.")
+        else:
+            print(f"Saved {len(plan['interviews'])} interviews ({rows_written} rows written in "
+                + f"{time.perf_counter() - started:.2f} s).")
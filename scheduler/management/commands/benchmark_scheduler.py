@@ -0,0 +1,82 @@
+# -*- coding: utf8 -*-
+
+# A management command for benchmarking the scheduler on synthetic problems.
+# Run with python manage.py benchmark_scheduler --applicants 500 2000 10000 in root folder.
+# Each problem is generated and scheduled inside a transaction that is rolled back, so the
+# database is left unchanged. The results are written as JSON.
+
+import json
+
+from django.core import management
+from django.db import transaction
+
+from scheduler.benchmark import environment, generate_problem, run_benchmark
+from scheduler.engines import ENGINES
+from scheduler.models import Application, InterviewSlot
+
+
+class Command(management.BaseCommand):
+    help = 'Benchmark the interview scheduler on synthetic problems'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--applicants', type=int, nargs='+', default=[500],
+            help="Problem sizes to benchmark, in number of applicants")
+        parser.add_argument('--rooms', type=int, default=None,
+            help="Number of rooms (default: enough for 20 %% more slots than applicants)")
+        parser.add_argument('--days', type=int, default=8)
+        parser.add_argument('--slot-minutes', type=int, default=45)
+        parser.add_argument('--jobs', type=int, default=None,
+            help="Number of jobs (default: one per 20 applicants)")
+        parser.add_argument('--interviewers', type=int, default=None,
+            help="Number of interviewers (default: one per 10 applicants)")
+        parser.add_argument('--pool-sizes', type=int, nargs=3, default=[3, 3, 4],
+            help="Number of priority 1, 2 and 3 interviewers per job")
+        parser.add_argument('--applicant-busy-times', type=float, default=2,
+            help="Average number of busy times per applicant")
+        parser.add_argument('--interviewer-busy-times', type=float, default=4,
+            help="Average number of busy times per interviewer")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--engine', choices=ENGINES, nargs='+', default=['greedy'],
+            help="Scheduling engines to benchmark on each problem")
+        parser.add_argument('--improve-seconds', type=float, default=0,
+            help="Time limit for improving each schedule by local search")
+        parser.add_argument('--trace-memory', action='store_true',
+            help="Record peak Python memory per phase with tracemalloc (slows down the run)")
+        parser.add_argument('--existing', action='store_true',
+            help="Benchmark the problem already in the database instead of synthetic ones")
+        parser.add_argument('--output', default=None,
+            help="File to write the JSON results to (default: standard output)")
+
+    def handle(self, *args, **options):
+        if not options['existing'] and (InterviewSlot.objects.exists()
+            or Application.objects.exists()):
+            raise management.CommandError("The database already contains interview data. "
+                + "Run the benchmark on an empty database, or use --existing.")
+        runs = []
+        for applicants in [None] if options['existing'] else options['applicants']:
+            for engine in options['engine']:
+                with transaction.atomic():
+                    problem = None
+                    if applicants is not None:
+                        problem = generate_problem(applicants, rooms=options['rooms'],
+                            days=options['days'], slot_minutes=options['slot_minutes'],
+                            jobs=options['jobs'], interviewers=options['interviewers'],
+                            pool_sizes=options['pool_sizes'],
+                            applicant_busy_times=options['applicant_busy_times'],
+                            interviewer_busy_times=options['interviewer_busy_times'],
+                            seed=options['seed'])
+                    result = run_benchmark(options['seed'], options['trace_memory'], engine,
+                        options['improve_seconds'])
+                    transaction.set_rollback(True)
+                runs.append({"problem": problem, **result})
+                self.stderr.write(f"{result['applicants']} applicants, {engine} engine: "
+                    + f"{result['allocated']} allocated in {result['total_wall_s']:.2f} s ("
+                    + ", ".join(f"{phase} {measurement['wall_s']:.2f} s"
+                    for phase, measurement in result['phases'].items()) + ")")
+
+        results = json.dumps({"environment": environment(), "runs": runs}, indent=2)
+        if options['output'] is None:
+            self.stdout.write(results)
+        else:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(results + "\n")
@@ -0,0 +1,37 @@
+# -*- coding: utf8 -*-
+
+# A management command for saving the scheduling problem to a snapshot file.
+# Run with python manage.py dump_problem problem.npz in root folder.
+# The snapshot holds the problem as loaded by the scheduler, with integer ids and times in
+# NumPy arrays, so reruns, benchmarks and experiments can load it in milliseconds with
+# schedule_interviews --snapshot or Scheduler.from_snapshot instead of querying the database.
+# With --incremental, the problem of scheduling the unscheduled applications around the saved
+# interviews is dumped. A snapshot goes stale when the database changes.
+
+import os
+import time
+
+from django.core import management
+
+from scheduler.problem import Problem
+from scheduler.scheduler import assert_one_interview_slot_per_room_per_time
+
+
+class Command(management.BaseCommand):
+    help = 'Save the scheduling problem to a snapshot file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="File to write the snapshot to, such as problem.npz")
+        parser.add_argument('--incremental', action='store_true',
+            help="Only dump the unscheduled applications and the interviewers of their jobs, "
+                + "see schedule_interviews --incremental")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        assert_one_interview_slot_per_room_per_time()
+        problem = Problem.from_database(options['incremental'])
+        problem.save(options['output'])
+        print(f"Dumped {problem.num_applicants} applicants, {len(problem.interviewer_pks)} "
+            + f"interviewers and {problem.num_slots} interview slots to {options['output']} "
+            + f"({os.path.getsize(options['output']) / 1024:.0f} KiB) in "
+            + f"{time.perf_counter() - started:.2f} s.")
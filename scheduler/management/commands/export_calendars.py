@@ -0,0 +1,170 @@
+# -*- coding: utf8 -*-
+
+# A management command for exporting the scheduled interviews as iCalendar files.
+# Run with python manage.py export_calendars in root folder.
+# One .ics file is written for each interviewer and each room with interviews, to the
+# directory given by --output-dir, or to a zip archive with --zip. The interviews are loaded in
+# three queries and formatted by --workers threads, each one once and shared by the calendars
+# it is in. The same threads put the calendars together and write them.
+
+import datetime
+import itertools
+import os
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core import management
+from django.utils import timezone
+from django.utils.text import slugify
+
+from scheduler.db import scheduled_interview_slots
+
+# Longest line in an iCalendar file, in octets, before it is folded
+MAX_LINE_OCTETS = 75
+# Number of interviews formatted by each task given to the threads
+EVENTS_PER_TASK = 200
+
+
+class Command(management.BaseCommand):
+    help = 'Export the scheduled interviews as a calendar for each interviewer and room'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir', default='calendars',
+            help="Directory to write the .ics files to (default: calendars)")
+        parser.add_argument('--zip', metavar='FILE', default=None,
+            help="Write the .ics files to a zip archive instead of a directory")
+        parser.add_argument('--calendars', choices=["interviewers", "rooms"], nargs='+',
+            default=["interviewers", "rooms"], help="Which calendars to export (default: both)")
+        parser.add_argument('--workers', type=int, default=None,
+            help="Number of threads formatting and writing the calendars (default: chosen by "
+                + "Python)")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            calendars = get_calendars(options['calendars'], executor)
+            if options['zip'] is not None:
+                with zipfile.ZipFile(options['zip'], 'w', zipfile.ZIP_DEFLATED) as archive:
+                    # The calendars are put together in parallel and added to the archive in
+                    # order as they are ready
+                    for filename, content in executor.map(lambda calendar: (calendar[0],
+                        format_calendar(*calendar[1:])), calendars):
+                        archive.writestr(filename, content)
+                output = options['zip']
+            else:
+                os.makedirs(options['output_dir'], exist_ok=True)
+                list(executor.map(lambda calendar: write_calendar(options['output_dir'],
+                    *calendar), calendars))
+                output = options['output_dir']
+        print(f"Exported {len(calendars)} calendars to {output} in "
+            + f"{time.perf_counter() - started:.2f} s.")
+
+
+def get_calendars(kinds=("interviewers", "rooms"), executor=None):
+    """
+    Returns (filename, calendar name, events) for the calendar of each interviewer and room
+    with interviews, where events are formatted VEVENTs in order of start time. Makes three
+    queries: the interview slots with rooms, their interviewers and their applications with
+    applicants and jobs. The events are formatted in tasks of EVENTS_PER_TASK interviews by
+    executor, or in this thread without one.
+    """
+    interview_slots = list(scheduled_interview_slots().order_by('start_time', 'room__name',
+        'id'))
+    timestamp = format_time(datetime.datetime.now(datetime.timezone.utc))
+    tasks = [interview_slots[i:i + EVENTS_PER_TASK]
+        for i in range(0, len(interview_slots), EVENTS_PER_TASK)]
+    events = itertools.chain.from_iterable((map if executor is None else executor.map)(
+        lambda task: [format_event(interview_slot, timestamp) for interview_slot in task],
+        tasks))
+    interviewer_events = {}
+    room_events = {}
+    for interview_slot, event in zip(interview_slots, events):
+        for interviewer in interview_slot.interviewers.all():
+            interviewer_events.setdefault(interviewer, []).append(event)
+        room_events.setdefault(interview_slot.room, []).append(event)
+    calendars = []
+    for kind, owner_events in (("interviewers", interviewer_events), ("rooms", room_events)):
+        if kind not in kinds:
+            continue
+        for owner, events in sorted(owner_events.items(), key=lambda item: item[0].pk):
+            prefix = "interviewer" if kind == "interviewers" else "room"
+            filename = f"{prefix}-{owner.pk}-{slugify(str(owner)) or prefix}.ics"
+            calendars.append((filename, f"Interviews: {owner}", events))
+    return calendars
+
+
+def format_event(interview_slot, timestamp):
+    # Returns the VEVENT of an interview slot, as folded lines ending with CRLF
+    applications = interview_slot.application_set.all()
+    # Assume only one applicant per interview
+    applicant = applications[0].applicant
+    description = "\n".join([
+        "Applied jobs: " + ", ".join(application.job.title for application in applications),
+        "Interviewers: " + ", ".join(interviewer.name
+            for interviewer in interview_slot.interviewers.all()),
+        "Applicant email: " + applicant.email,
+        "Applicant phone: " + applicant.phone])
+    return format_lines([
+        "BEGIN:VEVENT",
+        f"UID:interview-{interview_slot.pk}@bips",
+        f"DTSTAMP:{timestamp}",
+        f"DTSTART:{format_time(interview_slot.start_time)}",
+        f"DTEND:{format_time(interview_slot.end_time)}",
+        f"SUMMARY:{escape_text('Interview with ' + applicant.name)}",
+        f"LOCATION:{escape_text(interview_slot.room.name)}",
+        f"DESCRIPTION:{escape_text(description)}",
+        "END:VEVENT"])
+
+
+def format_calendar(name, events):
+    return "".join([format_lines([
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//BIPS//Interview scheduler//EN",
+        "CALSCALE:GREGORIAN",
+        f"X-WR-CALNAME:{escape_text(name)}"])]
+        + events + ["END:VCALENDAR\r\n"])
+
+
+def write_calendar(directory, filename, name, events):
+    with open(os.path.join(directory, filename), 'w', newline='', encoding='utf-8') as icsfile:
+        icsfile.write(format_calendar(name, events))
+
+
+def format_time(value):
+    # Times with a time zone are given in UTC, and times without one as floating local times
+    if timezone.is_aware(value):
+        return value.astimezone(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    return value.strftime("%Y%m%dT%H%M%S")
+
+
+def escape_text(text):
+    return (text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+        .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def format_lines(lines):
+    # Joins content lines with CRLF, folding lines longer than MAX_LINE_OCTETS into continuation
+    # lines starting with a space, without splitting UTF-8 characters
+    folded = []
+    for line in lines:
+        if len(line.encode('utf-8')) <= MAX_LINE_OCTETS:
+            folded.append(line)
+            continue
+        if line.isascii():
+            # One octet per character
+            folded.append(line[:MAX_LINE_OCTETS])
+            folded.extend(" " + line[i:i + MAX_LINE_OCTETS - 1]
+                for i in range(MAX_LINE_OCTETS, len(line), MAX_LINE_OCTETS - 1))
+            continue
+        part, octets = "", 0
+        for char in line:
+            char_octets = len(char.encode('utf-8'))
+            if octets + char_octets > MAX_LINE_OCTETS:
+                folded.append(part)
+                part, octets = " ", 1
+            part += char
+            octets += char_octets
+        folded.append(part)
+    return "".join(line + "\r\n" for line in folded)
@@ -2,41 +2,133 @@
 
 # A management command for exporting interviews to a CSV file.
 # Run with python manage.py export_csv in root folder.
+# The interviews are read in chunks of --chunk-size slots, with the room, interviewers and
+# applications of each chunk fetched in a few queries, and written as they are read. With
+# --format jsonl, each interview is written as a JSON object on its own line, and with
+# --format parquet (which needs pyarrow) as a row of a Parquet file. --output - writes CSV and
+# JSON lines to standard output.
 
 import csv
+import itertools
+import json
+import sys
+
 from django.core import management
-from scheduler.models import Application, InterviewSlot
+from django.db.models import Min
+
+from scheduler.db import scheduled_interview_slots
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FIELDS = ["Applicant name", "Applicant email", "Start time", "End time", "Room",
+    "Interviewers", "Applied jobs"]
+# Names of the fields in JSON lines and Parquet
+KEYS = [field.lower().replace(" ", "_") for field in FIELDS]
+
+# Ordering of the interview slots for each --order-by choice
+ORDERINGS = {
+    "start_time": ("start_time", "room__name", "id"),
+    "room": ("room__name", "start_time", "id"),
+    "applicant": ("applicant_name", "start_time", "id"),
+}
+
 
 class Command(management.BaseCommand):
-    help = "Export interviews to CSV"
+    help = "Export interviews to CSV, JSON lines or Parquet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None,
+            help="File to write to, or - for standard output (default: "
+                + "scheduled_interviews.csv, .jsonl or .parquet)")
+        parser.add_argument('--format', choices=["csv", "jsonl", "parquet"], default="csv",
+            help="Output format (parquet needs pyarrow)")
+        parser.add_argument('--order-by', choices=ORDERINGS, default="start_time",
+            help="Order of the interviews (default: start_time)")
+        parser.add_argument('--chunk-size', type=int, default=2000,
+            help="Number of interview slots read per query")
 
     def handle(self, *args, **options):
-        with open('scheduled_interviews.csv', 'w', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(["Applicant name", "Applicant email", "Start time", "End time",
-                "Room", "Interviewers", "Applied jobs"])
+        file_format = options['format']
+        output = options['output'] or f"scheduled_interviews.{file_format}"
+        if file_format == "parquet":
+            if pyarrow is None:
+                raise management.CommandError("Exporting to Parquet needs pyarrow, install it "
+                    + "with pip install pyarrow")
+            if output == "-":
+                raise management.CommandError("Parquet can't be written to standard output")
+        rows = interview_rows(options['order_by'], options['chunk_size'])
+        if file_format == "parquet":
+            count = write_parquet(rows, output, options['chunk_size'])
+        elif output == "-":
+            count = WRITERS[file_format](rows, sys.stdout)
+        else:
+            with open(output, 'w', newline='', encoding='utf-8') as outfile:
+                count = WRITERS[file_format](rows, outfile)
+        if output != "-":
+            print(f"Exported {count} interviews to {output}.")
+
+
+def interview_rows(order_by="start_time", chunk_size=2000):
+    """
+    Yields the values of FIELDS for each interview slot with an application, as a list where
+    Interviewers and Applied jobs are lists of names. The slots are streamed in chunks of
+    chunk_size from one query for the slots and rooms, and each chunk takes one query for the
+    interviewers and one for the applications, applicants and jobs.
+    """
+    interview_slots = scheduled_interview_slots()
+    if order_by == "applicant":
+        interview_slots = interview_slots.annotate(
+            applicant_name=Min('application__applicant__name'))
+    interview_slots = interview_slots.order_by(*ORDERINGS[order_by])
+    for interview_slot in interview_slots.iterator(chunk_size=chunk_size):
+        applications = interview_slot.application_set.all()
+        # Assume only one applicant per interview
+        applicant = applications[0].applicant
+        yield [applicant.name, applicant.email, interview_slot.start_time,
+            interview_slot.end_time, interview_slot.room.name,
+            [interviewer.name for interviewer in interview_slot.interviewers.all()],
+            [application.job.title for application in applications]]
 
-            applications = Application.objects.exclude(interview_slot=None).select_related("interview_slot", "applicant", "job")
-            interview_slots = {}
-            for application in applications:
-                interview_slots.setdefault(application.interview_slot, []).append(application)
 
-            for interview_slot in interview_slots:
-                related_applications = interview_slots[interview_slot]
+def write_csv(rows, outfile):
+    writer = csv.writer(outfile)
+    writer.writerow(FIELDS)
+    count = 0
+    for row in rows:
+        writer.writerow(row[:5] + [", ".join(row[5]), ", ".join(row[6])])
+        count += 1
+    return count
 
-                # Assume only one applicant per interview
-                applicant_name = related_applications[0].applicant.name
-                applicant_email = related_applications[0].applicant.email
 
-                start_time = interview_slot.start_time
-                end_time = interview_slot.end_time
-                room = interview_slot.room
+def write_jsonl(rows, outfile):
+    count = 0
+    for row in rows:
+        row[2], row[3] = row[2].isoformat(), row[3].isoformat()
+        outfile.write(json.dumps(dict(zip(KEYS, row)), ensure_ascii=False) + "\n")
+        count += 1
+    return count
 
-                interviewer_names = ", ".join([i.name for i in interview_slot.interviewers.all()])
 
-                applied_jobs = ", ".join([app.job.title for app in related_applications])
+def write_parquet(rows, path, batch_size):
+    # Writes a row group per batch_size rows, so only one batch is kept in memory
+    schema = pyarrow.schema(list(zip(KEYS, [pyarrow.string(), pyarrow.string(),
+        pyarrow.timestamp('us'), pyarrow.timestamp('us'), pyarrow.string(),
+        pyarrow.list_(pyarrow.string()), pyarrow.list_(pyarrow.string())])))
+    count = 0
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        batch = []
+        for row in itertools.chain(rows, [None]):
+            if row is not None:
+                batch.append(dict(zip(KEYS, row)))
+            if batch and (row is None or len(batch) == batch_size):
+                writer.write_table(pyarrow.Table.from_pylist(batch, schema=schema))
+                count += len(batch)
+                batch = []
+    return count
 
-                writer.writerow(
-                    [applicant_name, applicant_email, start_time, end_time, room, interviewer_names, applied_jobs]
-                )
 
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl}
@@ -0,0 +1,123 @@
+# -*- coding: utf8 -*-
+
+# A management command for generating interview slots.
+# Run with python manage.py generate_slots --first-date 2022-02-01 --last-date 2022-02-08
+# --rooms "Room 1" "Room 2" in root folder.
+# Slots of --slot-minutes are made in each room on each day, starting at --first-time and
+# every slot length plus --gap-minutes after that, up to and including --last-time. Rooms are
+# looked up by name and created if they don't exist, and a name can be repeated for several
+# rooms with the same name. Slots overlapping each other or a slot already in the database are
+# rejected before anything is written.
+
+import bisect
+import datetime
+import time
+
+from django.conf import settings
+from django.core import management
+from django.db import transaction
+from django.utils import timezone
+
+from scheduler.db import create_with_pks
+from scheduler.models import InterviewSlot, Room
+
+
+class Command(management.BaseCommand):
+    help = 'Generate interview slots for a range of days in a list of rooms'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--first-date', type=datetime.date.fromisoformat, required=True,
+            help="First day with interview slots (YYYY-MM-DD)")
+        parser.add_argument('--last-date', type=datetime.date.fromisoformat, required=True,
+            help="Last day with interview slots (YYYY-MM-DD)")
+        parser.add_argument('--first-time', type=datetime.time.fromisoformat,
+            default=datetime.time(9, 15), help="Start of the first slot of each day (HH:MM)")
+        parser.add_argument('--last-time', type=datetime.time.fromisoformat,
+            default=datetime.time(19, 45), help="Latest start of a slot on each day (HH:MM)")
+        parser.add_argument('--slot-minutes', type=int, default=45)
+        parser.add_argument('--gap-minutes', type=int, default=0,
+            help="Minutes between the end of a slot and the start of the next one")
+        parser.add_argument('--rooms', nargs='+', required=True,
+            help="Names of the rooms, which are created if they don't exist")
+        parser.add_argument('--dry-run', action='store_true',
+            help="Check the slots and print how many there would be, without saving them")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['slot_minutes'] <= 0 or options['gap_minutes'] < 0:
+            raise management.CommandError("The slot length must be positive and the gap can't "
+                + "be negative")
+        times = slot_times(options['first_date'], options['last_date'], options['first_time'],
+            options['last_time'], datetime.timedelta(minutes=options['slot_minutes']),
+            datetime.timedelta(minutes=options['gap_minutes']))
+        if not times:
+            raise management.CommandError("There are no slots between the given dates and "
+                + "times")
+        with transaction.atomic():
+            rooms = get_or_create_rooms(options['rooms'])
+            slots = [InterviewSlot(room_id=room.pk, start_time=start_time, end_time=end_time)
+                for room in rooms for start_time, end_time in times]
+            overlap = find_overlap(rooms, times)
+            if overlap is not None:
+                raise management.CommandError(f"A new slot from {overlap[1]} to {overlap[2]} "
+                    + f"in {overlap[0]} overlaps another slot in the room")
+            if options['dry_run']:
+                transaction.set_rollback(True)
+            else:
+                InterviewSlot.objects.bulk_create(slots, batch_size=1000)
+        print(f"{'Would generate' if options['dry_run'] else 'Generated'} {len(slots)} "
+            + f"interview slots in {len(rooms)} rooms in "
+            + f"{time.perf_counter() - started:.2f} s.")
+
+
+def slot_times(first_date, last_date, first_time, last_time, slot_length, gap):
+    # Returns the (start time, end time) of the slots of each day, in order
+    times = []
+    date = first_date
+    while date <= last_date:
+        start_time = datetime.datetime.combine(date, first_time)
+        last_start_time = datetime.datetime.combine(date, last_time)
+        while start_time <= last_start_time:
+            times.append((start_time, start_time + slot_length))
+            start_time += slot_length + gap
+        date += datetime.timedelta(days=1)
+    if settings.USE_TZ:
+        times = [(timezone.make_aware(start_time), timezone.make_aware(end_time))
+            for start_time, end_time in times]
+    return times
+
+
+def get_or_create_rooms(names):
+    # Returns a room for each name, using the existing rooms with the name before creating new
+    # ones
+    existing = {}
+    for room in Room.objects.filter(name__in=names).order_by('id'):
+        existing.setdefault(room.name, []).append(room)
+    rooms = []
+    for name in names:
+        rooms.append(existing[name].pop(0) if existing.get(name) else Room(name=name))
+    create_with_pks(Room, [room for room in rooms if room.pk is None])
+    return rooms
+
+
+def find_overlap(rooms, times):
+    """
+    Returns (room, start time, end time) of a new slot that overlaps another new slot or a slot
+    in the database in the same room, or None. times are the new slots of each room, in order
+    of start time and all of the same length. The existing slots of the rooms in the time span
+    of the new ones are fetched in one query.
+    """
+    for (_, end_time), (next_start_time, next_end_time) in zip(times, times[1:]):
+        if next_start_time < end_time:
+            return rooms[0], next_start_time, next_end_time
+    start_times = [start_time for start_time, _ in times]
+    rooms_by_pk = {room.pk: room for room in rooms}
+    existing = InterviewSlot.objects.filter(room__in=rooms, start_time__lt=times[-1][1],
+        end_time__gt=times[0][0]).order_by('room_id', 'start_time')
+    for room_id, start_time, end_time in existing.values_list('room_id', 'start_time',
+        'end_time'):
+        # The new slots starting before the existing one ends, the last of which ends latest
+        i = bisect.bisect_left(start_times, end_time) - 1
+        if i >= 0 and times[i][1] > start_time:
+            return rooms_by_pk[room_id], times[i][0], times[i][1]
+    return None
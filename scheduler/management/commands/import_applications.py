@@ -0,0 +1,114 @@
+# -*- coding: utf8 -*-
+
+# A management command for importing applicants and their applications from a CSV file.
+# Run with python manage.py import_applications applicants.csv in root folder.
+# Each row is an applicant, with the titles of the applied jobs separated by commas in one
+# column. Jobs that don't exist yet are created. The columns can be given by header name or by
+# number (counting from 0), and default to the layout of the application form export. The
+# whole file is imported in one transaction, so a failed import leaves the database unchanged.
+
+import csv
+import time
+
+from django.core import management
+from django.db import transaction
+
+from scheduler.db import create_with_pks
+from scheduler.models import Applicant, Application, Job
+
+# Default column numbers of each field
+COLUMNS = {"name": 1, "email": 2, "phone": 4, "jobs": 7}
+
+
+class Command(management.BaseCommand):
+    help = 'Import applicants and applications from a CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help="CSV file with one applicant per row")
+        for field, column in COLUMNS.items():
+            parser.add_argument(f'--{field}-column', default=str(column),
+                help=f"Header name or number of the {field} column (default: {column})")
+        parser.add_argument('--delimiter', default=',',
+            help="Separator between the columns (default: ,)")
+        parser.add_argument('--jobs-separator', default=',',
+            help="Separator between the job titles in the jobs column (default: ,)")
+        parser.add_argument('--no-header', action='store_true',
+            help="The first row is an applicant, not column names")
+        parser.add_argument('--encoding', default='utf-8-sig',
+            help="Encoding of the CSV file (default: UTF-8, with or without a byte order mark)")
+        parser.add_argument('--batch-size', type=int, default=1000,
+            help="Number of applicants inserted per query (default: 1000)")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        with open(options['csv_file'], newline='', encoding=options['encoding']) as csvfile:
+            rows = csv.reader(csvfile, delimiter=options['delimiter'])
+            header = None if options['no_header'] else next(rows, [])
+            columns = {field: column_number(header, options[f'{field}_column'])
+                for field in COLUMNS}
+            with transaction.atomic():
+                importer = ApplicationImporter(columns, options['jobs_separator'],
+                    options['batch_size'])
+                for row in rows:
+                    importer.add_row(row)
+                importer.flush()
+        elapsed = time.perf_counter() - started
+        print(f"Imported {importer.applicants} applicants and {importer.applications} "
+            + f"applications ({importer.new_jobs} new jobs) in {elapsed:.2f} s "
+            + f"({importer.rows / max(elapsed, 1e-9):.0f} rows/s).")
+
+
+class ApplicationImporter:
+    """
+    Inserts applicants and applications in batches. Jobs are loaded once and kept in a dict by
+    title, and the jobs first seen in a batch are inserted before its applications.
+    """
+
+    def __init__(self, columns, jobs_separator, batch_size):
+        self.columns = columns
+        self.jobs_separator = jobs_separator
+        self.batch_size = batch_size
+        self.jobs = {job.title: job for job in Job.objects.all()}
+        # Applicants of the current batch, with the titles of their applied jobs
+        self.batch = []
+        self.rows = self.applicants = self.applications = self.new_jobs = 0
+
+    def add_row(self, row):
+        self.rows += 1
+        if not any(cell.strip() for cell in row):
+            return
+        try:
+            fields = {field: row[column].strip() for field, column in self.columns.items()}
+        except IndexError:
+            raise management.CommandError(f"Row {self.rows} has only {len(row)} columns")
+        job_titles = [title.strip() for title in fields.pop("jobs").split(self.jobs_separator)]
+        self.batch.append((Applicant(**fields), [title for title in job_titles if title]))
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        new_jobs = {title: Job(title=title) for _, job_titles in self.batch
+            for title in job_titles if title not in self.jobs}
+        create_with_pks(Job, list(new_jobs.values()))
+        applicants = [applicant for applicant, _ in self.batch]
+        create_with_pks(Applicant, applicants)
+        self.jobs.update(new_jobs)
+        # An applicant applying twice for a job gets one application
+        applications = [Application(applicant=applicant, job=self.jobs[title])
+            for applicant, job_titles in self.batch for title in dict.fromkeys(job_titles)]
+        Application.objects.bulk_create(applications, batch_size=self.batch_size)
+        self.applicants += len(applicants)
+        self.applications += len(applications)
+        self.new_jobs += len(new_jobs)
+        self.batch = []
+
+
+def column_number(header, column):
+    # Returns the number of a column given by header name or by number
+    if header is not None and column in header:
+        return header.index(column)
+    if column.isdigit():
+        return int(column)
+    raise management.CommandError(f"No column named {column!r} in the header")
@@ -2,43 +2,136 @@
 
 # A management command for automatically scheduling interviews.
 # Run with python manage.py schedule_interviews in root folder.
+# With --seeds N, the scheduler is run with N different seeds in parallel (using --workers
+# processes) and the best schedule is kept. --profile prints scheduler statistics, and
+# --cprofile FILE also runs the scheduling under cProfile and saves the pstats to FILE.
+# With --incremental, only the applications that are not yet scheduled and the interviewers
+# who can interview for them are loaded, and they are scheduled around the saved interviews.
+# --engine matching assigns applicants to slots with a bipartite matching before picking
+# interviewers, see scheduler/matching.py. --improve-seconds S spends at most S seconds on
+# improving the schedule by local search, see scheduler/improve.py. --snapshot FILE loads the
+# problem from a file written by the dump_problem command instead of the database, and the
+# schedule is checked against the database before it is saved.
+# --plan-out FILE writes the schedule to a plan file without asking to save it, for saving
+# later with the apply_plan command.
+
+import cProfile
+import pstats
+import time
 
 from django.core import management
 
-from scheduler.scheduler import Scheduler
+from scheduler.engines import ENGINES
+from scheduler.models import Interviewer
+from scheduler.parallel import count_interviews_without_priority_1, schedule_with_seeds
+from scheduler.plan import apply_plan, make_plan, write_plan
+from scheduler.problem import Problem
+from scheduler.scheduler import assert_one_interview_slot_per_room_per_time
 
 
 class Command(management.BaseCommand):
     help = 'Automatically schedule interviews for admission'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--seeds', type=int, default=1,
+            help="Number of random seeds to try, keeping the best schedule")
+        parser.add_argument('--workers', type=int, default=None,
+            help="Number of worker processes used with --seeds (default: number of CPUs)")
+        parser.add_argument('--profile', action='store_true',
+            help="Print call counters and phase timings of the scheduler")
+        parser.add_argument('--cprofile', metavar='FILE', default=None,
+            help="Profile the scheduling with cProfile and save the stats to FILE (with "
+                + "--seeds, only the main process is profiled)")
+        parser.add_argument('--engine', choices=ENGINES, default='greedy',
+            help="Scheduling engine: greedy first fit, or matching of applicants to slots")
+        parser.add_argument('--improve-seconds', type=float, default=0,
+            help="Time limit for improving interviewer load balance and priority 1 "
+                + "interviewers after scheduling (default: no improvement)")
+        parser.add_argument('--incremental', action='store_true',
+            help="Only load the unscheduled applications and the interviewers of their jobs, "
+                + "for scheduling late applications around the saved interviews")
+        parser.add_argument('--snapshot', metavar='FILE', default=None,
+            help="Load the problem from a snapshot written by dump_problem instead of the "
+                + "database")
+        parser.add_argument('--plan-out', metavar='FILE', default=None,
+            help="Write the schedule to a plan file for apply_plan instead of asking to save "
+                + "it to the database")
+
     def handle(self, *args, **options):
+        if options['snapshot'] is not None and options['incremental']:
+            raise management.CommandError("--incremental is chosen when dumping the snapshot, "
+                + "with dump_problem --incremental")
+        problem = None
+        if options['snapshot'] is not None:
+            problem = Problem.load(options['snapshot'])
+
         # Schedule interviews
-        scheduler = Scheduler()
-        scheduler.schedule_interviews(silent=False)
+        profiler = None
+        if options['cprofile'] is not None:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        if options['seeds'] > 1:
+            if problem is None:
+                assert_one_interview_slot_per_room_per_time()
+                problem = Problem.from_database(options['incremental'])
+            scheduler = schedule_with_seeds(problem, range(options['seeds']), options['workers'],
+                options['engine'])
+            print("Kept the schedule from seed", scheduler.seed, "out of", options['seeds'],
+                "seeds.")
+            if options['improve_seconds'] > 0:
+                scheduler.improve(options['improve_seconds'])
+                scheduler.validate()
+        else:
+            scheduler = ENGINES[options['engine']](problem=problem,
+                incremental=options['incremental'])
+            scheduler.schedule_interviews(silent=False,
+                improve_seconds=options['improve_seconds'])
+        if options['improve_seconds'] > 0:
+            print("Improved the schedule cost from", scheduler.stats.improve_cost_before, "to",
+                scheduler.stats.improve_cost_after, "in",
+                f"{scheduler.stats.phase_seconds['improve']:.2f} s.")
+        if options['incremental']:
+            print("Loaded", scheduler.problem.num_applicants, "unscheduled applicants,",
+                len(scheduler.problem.interviewer_pks), "interviewers and",
+                scheduler.problem.num_slots, "free interview slots.")
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(options['cprofile'])
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+        if options['profile']:
+            print("Scheduler statistics:")
+            scheduler.stats.print_report()
 
-        print("Scheduled", len(scheduler.interview_list), "interviews.")
+        print("Scheduled", len(scheduler.interviews), "interviews.")
 
         print(len(scheduler.applied_jobs) - len(scheduler.unallocated_applicants), "out of",
             len(scheduler.applied_jobs), "applicants got an interview.")
 
         # Find and print number of interviews without a priority 1 interviewer for each job
-        print("There were",
-            sum(0 < sum(not sum(interviewer in job.possible_interviewers_1.all()
-            for interviewer in interview.interviewers)
-            for job in scheduler.applied_jobs[interview.applicant])
-            for interview in scheduler.interview_list),
+        print("There were", count_interviews_without_priority_1(scheduler.interviews,
+            scheduler.applied_jobs, scheduler.job_pools),
             "interviews where not all applied jobs had a first priority interviewer present.")
 
         # Find and print interviewers with more than ten interviews
         num_interviews = {}
-        for interview in scheduler.interview_list:
+        for interview in scheduler.interviews:
             for interviewer in interview.interviewers:
                 num_interviews[interviewer] = num_interviews.setdefault(interviewer, 0) + 1
 
         print("Interviewers with more than ten interviews:")
+        interviewer_pks = scheduler.problem.interviewer_pks.tolist()
+        interviewers = Interviewer.objects.in_bulk(
+            [interviewer_pks[interviewer] for interviewer in num_interviews])
         for interviewer in sorted(num_interviews, key = lambda i : num_interviews[i], reverse=True):
             if num_interviews[interviewer] > 10:
-                print(interviewer.first_name, interviewer.last_name, ":", num_interviews[interviewer])
+                print(interviewers[interviewer_pks[interviewer]].name, ":",
+                    num_interviews[interviewer])
+
+        if options['plan_out'] is not None:
+            write_plan(make_plan(scheduler), options['plan_out'])
+            print(f"Wrote the plan to {options['plan_out']}, save it with python manage.py "
+                + f"apply_plan {options['plan_out']}")
+            return
 
         save_interviews = input("Save interviews to database? (y/n)")
         if save_interviews != "y":
@@ -46,5 +139,16 @@ class Command(management.BaseCommand):
             return
 
         # Save scheduled interviews to database
-        scheduler.save_scheduled_interviews()
-        print("Saved interviews.")
+        if options['snapshot'] is not None:
+            # The database may have changed since the snapshot was dumped, so the interviews are
+            # checked against it in the saving transaction, as with apply_plan
+            started = time.perf_counter()
+            try:
+                rows_written = apply_plan(make_plan(scheduler))
+            except ValueError as error:
+                raise management.CommandError(f"{error}\nThe snapshot is out of date, dump it "
+                    + "again with dump_problem")
+            elapsed = time.perf_counter() - started
+        else:
+            rows_written, elapsed = scheduler.save_scheduled_interviews()
+        print(f"Saved interviews ({rows_written} rows written in {elapsed:.2f} s).")
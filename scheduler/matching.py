@@ -0,0 +1,158 @@
+# BIPS: Matching engine for scheduling interviews
+# Assigns applicants to interview slots with a maximum bipartite matching, and then picks the
+# interviewers of each assigned slot. Assignments that cannot be staffed at the priority level
+# they were matched at are dropped and the remaining applicants are matched again. Use with
+# schedule_interviews --engine matching.
+
+import time
+
+import numpy as np
+
+from .scheduler import Scheduler, from_bitsets
+
+# Job level of slots where a job has no available interviewer
+NO_INTERVIEWER = 4
+
+
+class MatchingScheduler(Scheduler):
+    """
+    A Scheduler that replaces the first, greedy pass by rounds of two stages. First the
+    unallocated applicants are matched to free slots where they and enough interviewers are
+    available, trying the cheapest slots first: those with the best interviewer priorities,
+    and then the earliest. Then interviewers are picked for the matched slots in order of
+    time, as in the greedy pass, at the priority level the slot was matched at. Slots where
+    this fails are excluded for the applicant until their level gets worse. The second pass is
+    unchanged.
+    """
+
+    max_rounds = 10
+
+    def __init__(self, seed=0, problem=None, incremental=False):
+        super().__init__(seed, problem, incremental)
+        started = time.perf_counter()
+        num_jobs = len(self.job_pools)
+        # The best priority of the available interviewers of each job at each slot, and the
+        # number of available interviewers, see update_job_levels
+        self.job_level = np.full((num_jobs, self.problem.num_slots), NO_INTERVIEWER,
+            dtype=np.int8)
+        self.job_interviewer_count = np.zeros((num_jobs, self.problem.num_slots),
+            dtype=np.int32)
+        # The level at which no interviewers could be picked for the applicant, by slot
+        self.failed_slots = {}
+        self.stats.phase_seconds["load"] += time.perf_counter() - started
+
+    def update_job_levels(self):
+        # Recomputes job_level and job_interviewer_count at the free slots from the
+        # availability bitsets, which take the interviews scheduled so far into account
+        free_slots = np.flatnonzero(self.slot_is_free)
+        interviewer_available = from_bitsets([self.available_interviewers(slot)
+            for slot in free_slots.tolist()], len(self.problem.interviewer_pks))
+        for job, pool in enumerate(self.job_pools):
+            job_level = np.full(len(free_slots), NO_INTERVIEWER, dtype=np.int8)
+            job_interviewer_count = np.zeros(len(free_slots), dtype=np.int32)
+            for priority, interviewers in enumerate(pool.by_priority, 1):
+                if not interviewers:
+                    continue
+                available = interviewer_available[list(interviewers)]
+                job_level[(job_level == NO_INTERVIEWER) & available.any(axis=0)] = priority
+                job_interviewer_count += available.sum(axis=0, dtype=np.int32)
+            if self.problem.job_include_priority_1[job]:
+                job_level[job_level > 1] = NO_INTERVIEWER
+            self.job_level[job, free_slots] = job_level
+            self.job_interviewer_count[job, free_slots] = job_interviewer_count
+
+    def slot_level(self, applicant, interview_slot):
+        # The priority level the applicant's interview can get in the slot
+        return max(self.job_level[job, interview_slot] for job in self.applied_jobs[applicant])
+
+    def candidate_slots(self, applicant, slot_is_unmatched):
+        # Returns the free slots where the applicant and enough interviewers are available,
+        # cheapest first, with the unmatched ones before the matched ones
+        jobs = list(self.applied_jobs[applicant])
+        levels = self.job_level[jobs].max(axis=0)
+        candidates = (self.slot_is_free & self.applicant_slot_available[applicant]
+            & (levels < NO_INTERVIEWER) & (self.job_interviewer_count[jobs].sum(axis=0) >= 2))
+        failed_slots = self.failed_slots.get(applicant)
+        if failed_slots:
+            slots = list(failed_slots)
+            candidates[slots] &= levels[slots] > list(failed_slots.values())
+        slots = np.flatnonzero(candidates)
+        # Slots are numbered in the order they should be filled, so a stable sort orders them
+        # by level and then earliness
+        return slots[np.lexsort((levels[slots], ~slot_is_unmatched[slots]))].tolist()
+
+    def match_applicants(self, applicants):
+        """
+        Returns a dict from slot to applicant, matching as many of applicants as possible to
+        free slots with Kuhn's augmenting path algorithm. Applicants with fewer candidate
+        slots are matched first, and the search looks for an unmatched slot before moving
+        other applicants.
+        """
+        slot_is_unmatched = self.slot_is_free.copy()
+        slot_applicant = {}
+        num_candidates = {applicant: len(self.candidate_slots(applicant, slot_is_unmatched))
+            for applicant in applicants}
+        # A failed search leaves the matching unchanged, so the slots it visited cannot lead
+        # to an unmatched slot until the next successful one
+        visited = np.zeros(self.problem.num_slots, dtype=bool)
+        for applicant in sorted(applicants, key=lambda applicant: (num_candidates[applicant],
+            applicant)):
+            if num_candidates[applicant] == 0:
+                continue
+            # Depth first search for an unmatched slot, where path[k] is the slot tried for
+            # the applicant of stack[k]
+            stack = [(applicant, iter(self.candidate_slots(applicant, slot_is_unmatched)))]
+            path = []
+            while stack:
+                for slot in stack[-1][1]:
+                    if visited[slot]:
+                        continue
+                    visited[slot] = True
+                    path.append(slot)
+                    if slot_is_unmatched[slot]:
+                        # Move each applicant on the path to its new slot
+                        for (path_applicant, _), path_slot in zip(stack, path):
+                            slot_applicant[path_slot] = path_applicant
+                        slot_is_unmatched[slot] = False
+                        visited[:] = False
+                        stack = []
+                        break
+                    owner = slot_applicant[slot]
+                    stack.append((owner, iter(self.candidate_slots(owner, slot_is_unmatched))))
+                    break
+                else:
+                    stack.pop()
+                    if path:
+                        path.pop()
+        return slot_applicant
+
+    def pick_interviewers(self, slot_applicant):
+        # Picks interviewers for the matched slots in order of time, at the level each slot was
+        # matched at, since an earlier pick may have taken the interviewers that gave the slot
+        # its level. Returns the number of interviews added.
+        added = 0
+        for interview_slot in sorted(slot_applicant, key=lambda slot: (self.slot_start[slot],
+            slot)):
+            applicant = slot_applicant[interview_slot]
+            priority_level = self.slot_level(applicant, interview_slot)
+            interviewers = self.get_available_interviewers(self.applied_jobs[applicant],
+                interview_slot, priority_level)
+            if interviewers != False:
+                self.add_interview(applicant, interviewers, interview_slot)
+                added += 1
+            else:
+                self.failed_slots.setdefault(applicant, {})[interview_slot] = priority_level
+        return added
+
+    def _first_pass(self, silent):
+        for matching_round in range(1, self.max_rounds + 1):
+            self.update_job_levels()
+            slot_applicant = self.match_applicants(self.unallocated_applicants)
+            added = self.pick_interviewers(slot_applicant)
+            if not silent:
+                print(f"Progress: 1/2: round {matching_round}, matched "
+                    + f"{len(slot_applicant)} and scheduled {added} applicants")
+            if added == len(slot_applicant):
+                # Every matched applicant got interviewers, so no slots were excluded and
+                # matching again would give nothing new
+                break
@@ -0,0 +1,58 @@
+# BIPS: Running the scheduler with several seeds in parallel
+# The problem is snapshotted once and sent to each worker process, which schedules it without
+# touching the database. The best schedule is then validated and returned in the main process.
+
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+
+# Set in each worker process by init_worker
+_problem = None
+_engine = None
+
+
+def init_worker(problem_pickle, engine):
+    # Worker processes may be spawned rather than forked, so Django must be set up before the
+    # problem (which refers to scheduler modules importing the models) can be unpickled
+    global _problem, _engine
+    django.setup()
+    _problem = pickle.loads(problem_pickle)
+    _engine = engine
+
+
+def schedule_seed(seed):
+    from .engines import ENGINES
+    scheduler = ENGINES[_engine](seed, _problem)
+    scheduler.schedule_interviews(validate=False)
+    return seed, scheduler.interviews, scheduler.stats
+
+
+def schedule_with_seeds(problem, seeds, workers=None, engine="greedy"):
+    """
+    Schedules problem once for each seed with the engine (see ENGINES), using up to workers
+    processes, and returns a Scheduler holding the best schedule: the one with most allocated
+    applicants, and then fewest interviews without a priority 1 interviewer for each job.
+    """
+    from .scheduler import Scheduler
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+        initargs=(pickle.dumps(problem), engine)) as executor:
+        results = list(executor.map(schedule_seed, seeds))
+    job_pools = problem.interviewer_pools()
+    # max() keeps the first of equally good schedules, so the lowest seed wins ties
+    seed, interviews, stats = max(results, key=lambda result: (len(result[1]),
+        -count_interviews_without_priority_1(result[1], problem.applicant_jobs, job_pools)))
+    scheduler = Scheduler(seed, problem)
+    for interview in interviews:
+        scheduler.add_interview(interview.applicant, interview.interviewers,
+            interview.interview_slot)
+    # Report the work done by the worker rather than by replaying its schedule
+    scheduler.stats = stats
+    scheduler.validate()
+    return scheduler
+
+
+def count_interviews_without_priority_1(interviews, applied_jobs, job_pools):
+    # Number of interviews where not all applied jobs have a priority 1 interviewer present
+    return sum(any(interview.interviewers.isdisjoint(job_pools[job].priority_1)
+        for job in applied_jobs[interview.applicant]) for interview in interviews)
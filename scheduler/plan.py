@@ -0,0 +1,121 @@
+# BIPS: Schedule plans
+# A plan is a computed schedule saved to a JSON file instead of the database, so that the
+# scheduling and the saving can be done separately. See the --plan-out option of
+# schedule_interviews and the apply_plan command.
+
+import datetime
+import json
+
+from django.db import transaction
+
+from .models import Application
+from .parallel import count_interviews_without_priority_1
+from .problem import Interview, Problem
+from .scheduler import (BREAK_LENGTH, MAX_CONTINUOUS_WORK, MINUTE, TRAVEL_TIME,
+    assert_one_interview_slot_per_room_per_time, save_interviews)
+from .validation import find_violations
+
+# Version of the plan format, increased on incompatible changes
+PLAN_VERSION = 1
+
+
+def make_plan(scheduler):
+    """
+    Returns the plan of the interviews of a scheduler, as a dict with the slot pk, interviewer
+    pks and application pks of each interview, and summary metrics of the schedule.
+    """
+    num_interviews = {}
+    for interview in scheduler.interviews:
+        for interviewer in interview.interviewers:
+            num_interviews[interviewer] = num_interviews.get(interviewer, 0) + 1
+    return {
+        "plan_version": PLAN_VERSION,
+        "created": datetime.datetime.now().isoformat(timespec='seconds'),
+        "seed": scheduler.seed,
+        "summary": {
+            "interviews": len(scheduler.interviews),
+            "applicants": scheduler.problem.num_applicants,
+            "unallocated_applicants": len(scheduler.unallocated_applicants),
+            "interviews_without_priority_1": count_interviews_without_priority_1(
+                scheduler.interviews, scheduler.applied_jobs, scheduler.job_pools),
+            "max_interviews_per_interviewer": max(num_interviews.values(), default=0),
+        },
+        "interviews": [{"interview_slot": slot_pk, "interviewers": interviewer_pks,
+            "applications": application_pks}
+            for slot_pk, interviewer_pks, application_pks in scheduler.interview_pks()],
+    }
+
+
+def write_plan(plan, path):
+    with open(path, 'w', encoding='utf-8') as plan_file:
+        json.dump(plan, plan_file, indent=1)
+
+
+def read_plan(path):
+    with open(path, encoding='utf-8') as plan_file:
+        plan = json.load(plan_file)
+    if not isinstance(plan, dict) or plan.get("plan_version") != PLAN_VERSION:
+        raise ValueError(f"{path} is not a schedule plan of version {PLAN_VERSION}")
+    return plan
+
+
+def find_plan_errors(problem, plan):
+    """
+    Returns a list of reasons why the interviews of a plan can't be saved to the database that
+    problem was loaded from: applications that have been scheduled, withdrawn or deleted,
+    applicants with applications outside their interview, slots that are no longer free,
+    missing interviewers and broken scheduling rules.
+    """
+    applicant_id = {pk: applicant
+        for applicant, application_pks in enumerate(problem.application_pks)
+        for pk in application_pks}
+    interviewer_id = {pk: i for i, pk in enumerate(problem.interviewer_pks.tolist())}
+    slot_id = {pk: i for i, pk in enumerate(problem.slot_pks.tolist())}
+    errors = []
+    interviews = []
+    for interview in plan["interviews"]:
+        slot_pk = interview["interview_slot"]
+        missing = [pk for pk in interview["applications"] if pk not in applicant_id]
+        if missing:
+            errors.append(f"Applications {missing} are no longer unscheduled")
+            continue
+        applicants = {applicant_id[pk] for pk in interview["applications"]}
+        applicant = min(applicants, default=None)
+        if (len(applicants) != 1
+            or set(interview["applications"]) != set(problem.application_pks[applicant])):
+            errors.append(f"The interview in slot {slot_pk} is not for all the unscheduled "
+                + "applications of one applicant")
+            continue
+        if slot_pk not in slot_id:
+            errors.append(f"Interview slot {slot_pk} is no longer free")
+            continue
+        missing = [pk for pk in interview["interviewers"] if pk not in interviewer_id]
+        if missing:
+            errors.append(f"Interviewers {missing} no longer exist")
+            continue
+        interviews.append(Interview(applicant,
+            frozenset(interviewer_id[pk] for pk in interview["interviewers"]), slot_id[slot_pk]))
+    errors.extend(violation.describe(problem) for violation in find_violations(problem,
+        interviews, TRAVEL_TIME // MINUTE, MAX_CONTINUOUS_WORK // MINUTE,
+        BREAK_LENGTH // MINUTE))
+    return errors
+
+
+def apply_plan(plan, batch_size=500, dry_run=False):
+    """
+    Validates the plan against the current database and saves its interviews, in one
+    transaction. The unscheduled applications are locked first on databases that support it,
+    so they can't be scheduled by anyone else in between. Returns the number of rows written,
+    or raises ValueError with the errors of an invalid plan.
+    """
+    with transaction.atomic():
+        list(Application.objects.select_for_update().filter(interview_slot=None,
+            withdrawn=False).values_list('id', flat=True))
+        assert_one_interview_slot_per_room_per_time()
+        errors = find_plan_errors(Problem.from_database(), plan)
+        if errors:
+            raise ValueError("The plan is not valid:\n" + "\n".join(errors))
+        if dry_run:
+            return 0
+        return save_interviews([(interview["interview_slot"], interview["interviewers"],
+            interview["applications"]) for interview in plan["interviews"]], batch_size)
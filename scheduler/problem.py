@@ -0,0 +1,322 @@
+# BIPS: Compiled scheduling problem
+# A snapshot of everything the scheduler needs from the database, with dense integer ids
+# instead of model instances and epoch minutes instead of datetimes. Results are mapped back
+# to model instances only when they are saved or reported.
+
+import datetime
+import struct
+import zipfile
+
+import numpy as np
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import (Applicant, Application, BusyTime, Interviewer, InterviewSlot, Job,
+    Room)
+
+EPOCH = datetime.datetime(1970, 1, 1)
+MINUTE = datetime.timedelta(minutes=1)
+
+# Version of the snapshot format written by Problem.save, increased on incompatible changes
+SNAPSHOT_VERSION = 1
+
+
+class Interview:
+    def __init__(self, applicant, interviewers, interview_slot):
+        self.applicant = applicant
+        self.interviewers = interviewers
+        self.interview_slot = interview_slot
+
+    def __eq__(self, other):
+        # Used by unit tests to assert that two Interview objects are equal
+        return (isinstance(other, Interview) and
+            self.applicant == other.applicant and
+            self.interviewers == other.interviewers and
+            self.interview_slot == other.interview_slot)
+
+    def print_full(self):
+        print()
+        print("Applicant: ", self.applicant.name)
+        print("Interviewers: ")
+        for interviewer in self.interviewers:
+            print(interviewer.name)
+        print("Time: ", self.interview_slot.start_time, "-", self.interview_slot.end_time)
+        print("Room: ", self.interview_slot.room)
+
+
+class InterviewerPool:
+    """
+    The possible interviewers of a job: as tuples by priority, for picking interviewers in
+    order, and as frozensets, for membership tests.
+    """
+
+    __slots__ = ('by_priority', 'priority_1', 'all')
+
+    def __init__(self, by_priority):
+        self.by_priority = tuple(tuple(interviewers) for interviewers in by_priority)
+        self.priority_1 = frozenset(self.by_priority[0])
+        self.all = frozenset().union(*self.by_priority)
+
+
+class Problem:
+    """
+    Rooms, free interview slots, applicants, jobs and interviewers are numbered 0, 1, ...
+    and the *_pks arrays map these ids back to database primary keys. Free interview slots are
+    numbered by room and start time, which is the order the scheduler fills them in. Busy
+    times are stored as parallel arrays, one row per busy time, with room -1 for busy times
+    that are not interviews.
+    """
+
+    __slots__ = (
+        'room_pks', 'slot_pks', 'applicant_pks', 'job_pks', 'interviewer_pks',
+        # Free interview slots
+        'slot_room', 'slot_start', 'slot_end',
+        # For each applicant, the applied jobs and the primary keys of the applications
+        'applicant_jobs', 'application_pks',
+        # For each job, a tuple of priority 1, 2 and 3 interviewers
+        'job_interviewers', 'job_include_priority_1',
+        'applicant_busy_applicant', 'applicant_busy_start', 'applicant_busy_end',
+        'interviewer_busy_interviewer', 'interviewer_busy_start', 'interviewer_busy_end',
+        'interviewer_busy_room',
+    )
+
+    @classmethod
+    def from_database(cls, incremental=False):
+        """
+        Loads the problem of scheduling the unscheduled, non-withdrawn applications into the
+        free interview slots. With incremental, only the jobs applied for by these
+        applications and the interviewers in their pools are loaded, with the busy times and
+        existing interviews of those interviewers. This is much faster when only a few late
+        applications are left to schedule.
+        """
+        problem = cls()
+        pending_applications = Application.objects.filter(interview_slot=None, withdrawn=False)
+        jobs = Job.objects.all()
+        interviewers = Interviewer.objects.all()
+        if incremental:
+            jobs = jobs.filter(pk__in=pending_applications.values('job_id'))
+            interviewers = interviewers.filter(Q(jobs_possible_interviewers_1__in=jobs)
+                | Q(jobs_possible_interviewers_2__in=jobs)
+                | Q(jobs_possible_interviewers_3__in=jobs))
+        problem.room_pks = np.array(Room.objects.order_by('id').values_list('id', flat=True),
+            dtype=np.int64)
+        room_id = {pk: i for i, pk in enumerate(problem.room_pks.tolist())}
+        problem.interviewer_pks = np.array(
+            interviewers.order_by('id').values_list('id', flat=True).distinct(), dtype=np.int64)
+        interviewer_id = {pk: i for i, pk in enumerate(problem.interviewer_pks.tolist())}
+
+        slots = list(InterviewSlot.objects.filter(application=None).order_by(
+            'room_id', 'start_time', 'id').values_list('id', 'room_id', 'start_time',
+            'end_time'))
+        problem.slot_pks = np.array([slot[0] for slot in slots], dtype=np.int64)
+        problem.slot_room = np.array([room_id[slot[1]] for slot in slots], dtype=np.int32)
+        problem.slot_start = np.array([to_minutes(slot[2]) for slot in slots], dtype=np.int64)
+        problem.slot_end = np.array([to_minutes(slot[3]) for slot in slots], dtype=np.int64)
+
+        jobs = list(jobs.order_by('id').values_list('id', 'include_priority_1_interviewer'))
+        problem.job_pks = np.array([job[0] for job in jobs], dtype=np.int64)
+        problem.job_include_priority_1 = np.array([job[1] for job in jobs], dtype=bool)
+        job_id = {pk: i for i, pk in enumerate(problem.job_pks.tolist())}
+        interviewer_pools = get_interviewer_pools(
+            problem.job_pks.tolist() if incremental else None)
+        problem.job_interviewers = tuple(tuple(tuple(interviewer_id[interviewer_pk]
+            for interviewer_pk in interviewers)
+            for interviewers in interviewer_pools[job_pk].by_priority)
+            for job_pk in problem.job_pks.tolist())
+
+        applications = {}
+        for application_pk, applicant_pk, job_pk in pending_applications.order_by(
+            'applicant_id', 'id').values_list('id', 'applicant_id', 'job_id'):
+            applications.setdefault(applicant_pk, []).append((application_pk, job_id[job_pk]))
+        problem.applicant_pks = np.array(list(applications), dtype=np.int64)
+        problem.applicant_jobs = tuple(tuple(job for _, job in applicant_applications)
+            for applicant_applications in applications.values())
+        problem.application_pks = tuple(tuple(pk for pk, _ in applicant_applications)
+            for applicant_applications in applications.values())
+        applicant_id = {pk: i for i, pk in enumerate(applications)}
+
+        pending_applicants = pending_applications.values('applicant_id')
+        applicant_busy, interviewer_busy = [], []
+        for applicant_pk, interviewer_pk, begin, end in BusyTime.objects.filter(
+            Q(applicant__in=pending_applicants) | (Q(interviewer__in=interviewers.values('id'))
+            if incremental else Q(interviewer__isnull=False))).values_list(
+            'applicant_id', 'interviewer_id', 'begin', 'end'):
+            if applicant_pk is not None:
+                applicant_busy.append(
+                    (applicant_id[applicant_pk], to_minutes(begin), to_minutes(end)))
+            else:
+                interviewer_busy.append(
+                    (interviewer_id[interviewer_pk], to_minutes(begin), to_minutes(end), -1))
+        # Applicants with a late application may already have an interview for another one
+        for applicant_pk, start_time, end_time in InterviewSlot.objects.filter(
+            application__applicant__in=pending_applicants).values_list(
+            'application__applicant_id', 'start_time', 'end_time').distinct():
+            applicant_busy.append(
+                (applicant_id[applicant_pk], to_minutes(start_time), to_minutes(end_time)))
+        # Interviewers are busy when they are interviewing
+        existing_interviews = InterviewSlot.interviewers.through.objects.filter(
+            interviewslot__application__isnull=False)
+        if incremental:
+            existing_interviews = existing_interviews.filter(
+                interviewer__in=interviewers.values('id'))
+        for interviewer_pk, start_time, end_time, room_pk in existing_interviews.values_list(
+            'interviewer_id', 'interviewslot__start_time', 'interviewslot__end_time',
+            'interviewslot__room_id').distinct():
+            interviewer_busy.append((interviewer_id[interviewer_pk], to_minutes(start_time),
+                to_minutes(end_time), room_id[room_pk]))
+        problem.set_applicant_busy_times(applicant_busy)
+        problem.set_interviewer_busy_times(interviewer_busy)
+        return problem
+
+    def save(self, path):
+        """
+        Writes the problem to a snapshot at path, an uncompressed .npz file with an array for
+        each field, so that it can be loaded without the database (see load). Tuples of tuples
+        are stored as a flat array of values and an array of offsets, and job_interviewers as
+        such a tuple with three entries per job.
+        """
+        arrays = {'snapshot_version': np.array(SNAPSHOT_VERSION)}
+        for field in self.__slots__:
+            value = getattr(self, field)
+            if field == 'job_interviewers':
+                value = tuple(interviewers for job in value for interviewers in job)
+            if isinstance(value, tuple):
+                arrays[field + '_offsets'] = np.cumsum([0] + [len(item) for item in value],
+                    dtype=np.int64)
+                value = np.array([x for item in value for x in item], dtype=np.int64)
+            arrays[field] = value
+        with open(path, 'wb') as snapshot:
+            np.savez(snapshot, **arrays)
+
+    @classmethod
+    def load(cls, path, mmap_bytes=2**20):
+        """
+        Loads a problem from a snapshot written by save. Arrays of at least mmap_bytes, such as
+        large busy time tables, are memory-mapped from the file instead of read.
+        """
+        arrays = load_npz(path, mmap_bytes)
+        if 'snapshot_version' not in arrays or arrays['snapshot_version'] != SNAPSHOT_VERSION:
+            raise ValueError(f"{path} is not a problem snapshot of version {SNAPSHOT_VERSION}")
+        problem = cls()
+        for field in cls.__slots__:
+            value = arrays[field]
+            if field + '_offsets' in arrays:
+                values = value.tolist()
+                offsets = arrays[field + '_offsets'].tolist()
+                value = tuple(tuple(values[start:end])
+                    for start, end in zip(offsets, offsets[1:]))
+            if field == 'job_interviewers':
+                value = tuple(value[i:i+3] for i in range(0, len(value), 3))
+            setattr(problem, field, value)
+        return problem
+
+    def set_applicant_busy_times(self, busy_times):
+        busy_times = np.array(busy_times, dtype=np.int64).reshape(-1, 3)
+        self.applicant_busy_applicant = busy_times[:, 0]
+        self.applicant_busy_start = busy_times[:, 1]
+        self.applicant_busy_end = busy_times[:, 2]
+
+    def set_interviewer_busy_times(self, busy_times):
+        busy_times = np.array(busy_times, dtype=np.int64).reshape(-1, 4)
+        self.interviewer_busy_interviewer = busy_times[:, 0]
+        self.interviewer_busy_start = busy_times[:, 1]
+        self.interviewer_busy_end = busy_times[:, 2]
+        self.interviewer_busy_room = busy_times[:, 3]
+
+    @property
+    def num_applicants(self):
+        return len(self.applicant_pks)
+
+    @property
+    def num_slots(self):
+        return len(self.slot_pks)
+
+    def interviewer_pools(self):
+        return tuple(InterviewerPool(by_priority) for by_priority in self.job_interviewers)
+
+    def interviewer_busy_times(self):
+        # Returns a dict from interviewer to a list of (start, end, room) busy times, with room
+        # None for busy times that are not interviews
+        busy_times = {}
+        for interviewer, start, end, room in zip(self.interviewer_busy_interviewer.tolist(),
+            self.interviewer_busy_start.tolist(), self.interviewer_busy_end.tolist(),
+            self.interviewer_busy_room.tolist()):
+            busy_times.setdefault(interviewer, []).append(
+                (start, end, None if room == -1 else room))
+        return busy_times
+
+    def compile_interviews(self, interview_list):
+        # Converts Interview objects with model instances to Interview objects with ids
+        applicant_id = {pk: i for i, pk in enumerate(self.applicant_pks.tolist())}
+        interviewer_id = {pk: i for i, pk in enumerate(self.interviewer_pks.tolist())}
+        slot_id = {pk: i for i, pk in enumerate(self.slot_pks.tolist())}
+        return [Interview(applicant_id[interview.applicant.id],
+            frozenset(interviewer_id[interviewer.id] for interviewer in interview.interviewers),
+            slot_id[interview.interview_slot.id]) for interview in interview_list]
+
+    def orm_interviews(self, interviews):
+        # Converts Interview objects with ids to Interview objects with model instances
+        applicant_pks = self.applicant_pks.tolist()
+        interviewer_pks = self.interviewer_pks.tolist()
+        slot_pks = self.slot_pks.tolist()
+        applicants = Applicant.objects.in_bulk(
+            {applicant_pks[interview.applicant] for interview in interviews})
+        interviewers = Interviewer.objects.in_bulk({interviewer_pks[interviewer]
+            for interview in interviews for interviewer in interview.interviewers})
+        interview_slots = InterviewSlot.objects.select_related('room').in_bulk(
+            {slot_pks[interview.interview_slot] for interview in interviews})
+        return [Interview(applicants[applicant_pks[interview.applicant]],
+            {interviewers[interviewer_pks[interviewer]] for interviewer in interview.interviewers},
+            interview_slots[slot_pks[interview.interview_slot]])
+            for interview in interviews]
+
+def get_interviewer_pools(job_pks=None):
+    # Returns a dict from job primary key to the InterviewerPool of the job, with interviewer
+    # primary keys, for all jobs or the jobs in job_pks. Uses one query per priority.
+    pools = {job_pk: ([], [], []) for job_pk in (Job.objects.values_list('id', flat=True)
+        if job_pks is None else job_pks)}
+    for priority, field in enumerate((Job.possible_interviewers_1, Job.possible_interviewers_2,
+        Job.possible_interviewers_3)):
+        job_interviewers = field.through.objects.order_by('interviewer_id')
+        if job_pks is not None:
+            job_interviewers = job_interviewers.filter(job_id__in=job_pks)
+        for job_pk, interviewer_pk in job_interviewers.values_list('job_id', 'interviewer_id'):
+            pools[job_pk][priority].append(interviewer_pk)
+    return {job_pk: InterviewerPool(by_priority) for job_pk, by_priority in pools.items()}
+
+def load_npz(path, mmap_bytes):
+    # Returns a dict of the arrays in an .npz file. Arrays of at least mmap_bytes that are
+    # stored uncompressed are memory-mapped at their offset in the file, which np.load doesn't
+    # do for .npz files.
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as npz_file:
+        for info in archive.infolist():
+            name = info.filename[:-len('.npy')]
+            if info.compress_type != zipfile.ZIP_STORED or info.file_size < mmap_bytes:
+                with archive.open(info) as npy_file:
+                    arrays[name] = np.lib.format.read_array(npy_file)
+                continue
+            # The data follows the local file header, which has a fixed part of 30 bytes ending
+            # with the lengths of the file name and the extra field
+            npz_file.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack('<HH', npz_file.read(4))
+            npz_file.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(npz_file)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(npz_file)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(npz_file)
+            if dtype.hasobject or 0 in shape:
+                npz_file.seek(info.header_offset)
+                with archive.open(info) as npy_file:
+                    arrays[name] = np.lib.format.read_array(npy_file)
+                continue
+            arrays[name] = np.memmap(npz_file, dtype=dtype, mode='r', offset=npz_file.tell(),
+                shape=shape, order='F' if fortran_order else 'C')
+    return arrays
+
+def to_minutes(time):
+    # Minutes since EPOCH, for naive and aware datetimes
+    if timezone.is_aware(time):
+        time = timezone.make_naive(time, datetime.timezone.utc)
+    return (time - EPOCH) // MINUTE
@@ -1,10 +1,22 @@
 # BIPS: Scheduler class for automatically scheduling interviews
 # See schedule_interviews.py for use.
 
+import bisect
 import random
 import datetime
+import time
 
+import numpy as np
+from django.db import connection, transaction
+from django.db.models import F, Max, Q, RowRange, Window
+from django.db.models.functions import Lead
+
+from .improve import Improver
+from .intervals import BusyTimeIndex, WorkRuns
 from .models import Application, InterviewSlot, BusyTime
+from .problem import MINUTE, Interview, Problem
+from .stats import SchedulerStats
+from .validation import find_violations
 
 TRAVEL_TIME = datetime.timedelta(minutes=30) # represents travel time between rooms
 
@@ -13,130 +25,300 @@ TRAVEL_TIME = datetime.timedelta(minutes=30) # represents travel time between ro
 MAX_CONTINUOUS_WORK = datetime.timedelta(hours=4)
 BREAK_LENGTH = datetime.timedelta(minutes=20)
 
-class Interview:
-    def __init__(self, applicant, interviewers, interview_slot):
-        self.applicant = applicant
-        self.interviewers = interviewers
-        self.interview_slot = interview_slot
-
-    def __eq__(self, other):
-        # Used by unit tests to assert that two Interview objects are equal
-        return (isinstance(other, Interview) and
-            self.applicant == other.applicant and
-            self.interviewers == other.interviewers and
-            self.interview_slot == other.interview_slot)
-
-    def print_full(self):
-        print()
-        print("Applicant: ", self.applicant.name)
-        print("Interviewers: ")
-        for interviewer in self.interviewers:
-            print(interviewer.first_name, interviewer.last_name)
-        print("Time: ", self.interview_slot.start_time, "-", self.interview_slot.end_time)
-        print("Room: ", self.interview_slot.room)
+# Minutes per day, for versioning failed probes by day
+DAY = 24 * 60
+
+# Returned by Scheduler.available_rooms when an interviewer can take a slot in any room
+ALL_ROOMS = -1
+
+# The second pass places an applicant by moving the applicant of an interview to another slot,
+# which may in turn move another applicant, in chains of at most RESCHEDULE_DEPTH moves. Each
+# moved applicant tries at most RESCHEDULE_BREADTH taken slots (the first applicant tries all).
+RESCHEDULE_DEPTH = 2
+RESCHEDULE_BREADTH = 10
 
 class Scheduler:
-    def __init__(self, seed=0):
-        assert_one_interview_slot_per_room_per_time()
-        self.applicant_busy_times, self.interviewer_busy_time_space = get_busy_times()
-        self.available_interview_slots = set(
-            InterviewSlot.objects.filter(application=None).select_related('room'))
-        self.applications = get_applications()
-        self.applied_jobs = {applicant: [application.job for application in applications]
-            for applicant, applications in self.applications.items()}
-        self.unallocated_applicants = set(self.applications.keys())
-        self.interview_list = []
+    """
+    Schedules the interviews of a Problem. Applicants, interviewers, jobs and interview slots
+    are referred to by their ids in the problem, and interviews are stored as Interview
+    objects with ids in self.interviews.
+    """
+
+    def __init__(self, seed=0, problem=None, incremental=False):
+        # Without a problem, it is loaded from the database, see Problem.from_database
+        started = time.perf_counter()
+        self.stats = SchedulerStats()
+        if problem is None:
+            assert_one_interview_slot_per_room_per_time()
+            problem = Problem.from_database(incremental)
+        self.problem = problem
+        self.travel_time = TRAVEL_TIME // MINUTE
+        self.max_continuous_work = MAX_CONTINUOUS_WORK // MINUTE
+        self.break_length = BREAK_LENGTH // MINUTE
+        # Python lists are faster than NumPy arrays for scalar lookups
+        self.slot_start = problem.slot_start.tolist()
+        self.slot_end = problem.slot_end.tolist()
+        self.slot_room = problem.slot_room.tolist()
+        # Slots with the same start and end time form a time group. Groups are numbered in
+        # order of start time, for finding the groups near an interview.
+        group_times = sorted(set(zip(self.slot_start, self.slot_end)))
+        group_index = {times: group for group, times in enumerate(group_times)}
+        self.slot_group = [group_index[times] for times in zip(self.slot_start, self.slot_end)]
+        self.group_start = [start for start, end in group_times]
+        self.group_end = [end for start, end in group_times]
+        self.longest_slot = max([end - start for start, end in group_times], default=0)
+        interviewer_busy_time_space = problem.interviewer_busy_times()
+        self.interviewer_busy_time_space = {interviewer: BusyTimeIndex(busy_time_space)
+            for interviewer, busy_time_space in interviewer_busy_time_space.items()}
+        # Interviews (busy times with a room) merged into continuous work runs
+        self.interviewer_work_runs = {interviewer: WorkRuns(self.break_length,
+            [(start, end) for start, end, room in busy_time_space if room is not None])
+            for interviewer, busy_time_space in interviewer_busy_time_space.items()}
+        # Slots are numbered by room and start time, so that the early interview slots are
+        # filled up first
+        self.slot_is_free = np.ones(problem.num_slots, dtype=bool)
+        self.applied_jobs = problem.applicant_jobs
+        # Interviewer pools of each job, materialized once per run
+        self.job_pools = problem.interviewer_pools()
+        # The interviewers of each job by priority, as bitsets with bit i set for interviewer i
+        self.job_pool_masks = [tuple(sum(1 << interviewer for interviewer in interviewers)
+            for interviewers in pool.by_priority) for pool in self.job_pools]
+        # The interviewers able to take the slots of each time group, as bitsets: those
+        # available in every room, and for each room those available only there (after an
+        # interview in that room within travel time). Busy times and travel time are applied
+        # to all slots at once, and breaks only near existing interviews. Kept up to date by
+        # book_interviewer and release_interviewer, see available_interviewers.
+        slot_available_interviewers = to_bitsets(
+            get_interviewer_availability(problem, self.travel_time))
+        self.group_available = [-1] * len(group_times)
+        for group, available in zip(self.slot_group, slot_available_interviewers):
+            self.group_available[group] &= available
+        self.group_room_available = [{} for _ in group_times]
+        # The room of each interviewer in group_room_available
+        self.group_interviewer_room = [{} for _ in group_times]
+        for slot, available in enumerate(slot_available_interviewers):
+            group = self.slot_group[slot]
+            available &= ~self.group_available[group]
+            if available:
+                self.group_room_available[group][self.slot_room[slot]] = available
+                for interviewer in range(available.bit_length()):
+                    if available >> interviewer & 1:
+                        self.group_interviewer_room[group][interviewer] = self.slot_room[slot]
+        for interviewer, work_runs in self.interviewer_work_runs.items():
+            for run_start, run_end in work_runs:
+                self.update_group_availability(interviewer, run_start - self.break_length,
+                    run_end + self.break_length, booked=True)
+        # Applicant availability never changes, so it is computed once for every slot
+        self.applicant_slot_available = get_applicant_availability(problem)
+        self.unallocated_applicants = set(range(problem.num_applicants))
+        self.interviews = []
+        # The interview in each taken slot, and its index in self.interviews
+        self.slot_interview = {}
+        self.slot_index = {}
+        self.reschedule_depth = RESCHEDULE_DEPTH
+        self.reschedule_breadth = RESCHEDULE_BREADTH
+        # Moves of an applicant out of a slot that failed with at most the given depth, since
+        # the last successful reschedule
+        self.failed_moves = {}
+        # For each (applicant, slot), the highest priority level at which no interviewers
+        # were found, with the versions of the applied jobs on the day of the slot at the
+        # time. Releasing an interviewer is the only way a failed probe can succeed later, and
+        # it can only affect the slots whose availability it rechecks, so it bumps the
+        # versions of the interviewer's jobs on the days of those slots.
+        self.failed_probes = {}
+        self.job_day_version = {}
+        self.interviewer_jobs = {}
+        for job, pool in enumerate(self.job_pools):
+            for interviewer in pool.all:
+                self.interviewer_jobs.setdefault(interviewer, []).append(job)
+        self.seed = seed
         random.seed(seed)
+        self.stats.phase_seconds["load"] = time.perf_counter() - started
+
+    @classmethod
+    def from_snapshot(cls, path, seed=0):
+        # Loads the problem from a snapshot written by the dump_problem command, see
+        # Problem.load. The database is only needed for saving the schedule.
+        return cls(seed, Problem.load(path))
+
+    @property
+    def interview_list(self):
+        # The scheduled interviews, with model instances
+        return self.problem.orm_interviews(self.interviews)
 
     def add_interview(self, applicant, interviewers, interview_slot, index=None):
-        if index is None:
-            self.interview_list.append(Interview(applicant, interviewers, interview_slot))
+        # With index, the interview is put at index and the interview there is moved to the
+        # end, which undoes remove_interview(index)
+        interview = Interview(applicant, interviewers, interview_slot)
+        if index is None or index == len(self.interviews):
+            index = len(self.interviews)
+            self.interviews.append(interview)
         else:
-            self.interview_list.insert(index, Interview(applicant, interviewers, interview_slot))
+            moved = self.interviews[index]
+            self.slot_index[moved.interview_slot] = len(self.interviews)
+            self.interviews.append(moved)
+            self.interviews[index] = interview
+        self.slot_interview[interview_slot] = interview
+        self.slot_index[interview_slot] = index
         self.unallocated_applicants.remove(applicant)
         # The interviewers are now busy at this time
         for interviewer in interviewers:
-            self.interviewer_busy_time_space.setdefault(interviewer.id, set()).add(
-                (interview_slot.start_time, interview_slot.end_time, interview_slot.room))
+            self.book_interviewer(interviewer, interview_slot)
         # The interviewslot is now taken
-        self.available_interview_slots.remove(interview_slot)
+        self.slot_is_free[interview_slot] = False
 
     def remove_interview(self, index):
-        interview = self.interview_list[index]
+        # The last interview is moved to index, so removing is O(1)
+        interview = self.interviews[index]
         interview_slot = interview.interview_slot
         self.unallocated_applicants.add(interview.applicant)
         # The interviewers are now available at this time
         for interviewer in interview.interviewers:
-            self.interviewer_busy_time_space.get(interviewer.id).remove(
-                (interview_slot.start_time, interview_slot.end_time, interview_slot.room))
+            self.release_interviewer(interviewer, interview_slot)
         # The interviewslot is now available
-        self.available_interview_slots.add(interview_slot)
-        del self.interview_list[index]
+        self.slot_is_free[interview_slot] = True
+        del self.slot_interview[interview_slot]
+        del self.slot_index[interview_slot]
+        last = self.interviews.pop()
+        if index < len(self.interviews):
+            self.interviews[index] = last
+            self.slot_index[last.interview_slot] = index
+
+    def book_interviewer(self, interviewer, interview_slot):
+        start_time = self.slot_start[interview_slot]
+        end_time = self.slot_end[interview_slot]
+        self.interviewer_busy_time_space.setdefault(interviewer, BusyTimeIndex()).add(
+            (start_time, end_time, self.slot_room[interview_slot]))
+        work_runs = self.interviewer_work_runs.setdefault(interviewer,
+            WorkRuns(self.break_length))
+        work_runs.add(start_time, end_time)
+        self.update_interviewer_availability(interviewer, start_time, end_time,
+            work_runs.run_at(start_time), booked=True)
+
+    def release_interviewer(self, interviewer, interview_slot):
+        start_time = self.slot_start[interview_slot]
+        end_time = self.slot_end[interview_slot]
+        self.interviewer_busy_time_space[interviewer].remove(
+            (start_time, end_time, self.slot_room[interview_slot]))
+        run = self.interviewer_work_runs[interviewer].run_at(start_time)
+        self.interviewer_work_runs[interviewer].remove(start_time, end_time)
+        window_start, window_end = self.update_interviewer_availability(interviewer,
+            start_time, end_time, run, booked=False)
+        # The rechecked slots overlap the window, so they start at most longest_slot before it
+        for day in range((window_start - self.longest_slot) // DAY, window_end // DAY + 1):
+            for job in self.interviewer_jobs.get(interviewer, ()):
+                self.job_day_version[(job, day)] = self.job_day_version.get((job, day), 0) + 1
+
+    def update_interviewer_availability(self, interviewer, start_time, end_time, run, booked):
+        # Booking or releasing the interviewer for [start_time, end_time) in the work run can
+        # only change the slots within travel time of it (busy times) or within break_length
+        # of the run (breaks). Returns the window of time that was rechecked.
+        window_start = min(start_time - self.travel_time, run[0] - self.break_length)
+        window_end = max(end_time + self.travel_time, run[1] + self.break_length)
+        self.update_group_availability(interviewer, window_start, window_end, booked)
+        return window_start, window_end
+
+    def update_group_availability(self, interviewer, start_time, end_time, booked):
+        # Rechecks the interviewer at the time groups overlapping [start_time, end_time). A
+        # booking can only make slots unavailable, so groups where the interviewer is already
+        # unavailable are skipped.
+        bit = 1 << interviewer
+        first = bisect.bisect_left(self.group_start, start_time - self.longest_slot)
+        last = bisect.bisect_left(self.group_start, end_time)
+        for group in range(first, last):
+            interviewer_room = self.group_interviewer_room[group]
+            if self.group_end[group] <= start_time or (booked
+                and not self.group_available[group] & bit
+                and interviewer not in interviewer_room):
+                continue
+            room_available = self.group_room_available[group]
+            self.group_available[group] &= ~bit
+            room = interviewer_room.pop(interviewer, None)
+            if room is not None:
+                room_available[room] &= ~bit
+            room = self.available_rooms(interviewer, group)
+            if room == ALL_ROOMS:
+                self.group_available[group] |= bit
+            elif room is not None:
+                room_available[room] = room_available.get(room, 0) | bit
+                interviewer_room[interviewer] = room
+
+    def available_rooms(self, interviewer, group):
+        # Returns where the interviewer can take a slot of the time group: ALL_ROOMS, the room
+        # of the interviews within travel time if they are all in one room, or None. Checks the
+        # busy time, travel time and break rules for all slots of the group at once.
+        self.stats.group_rechecks += 1
+        start_time = self.group_start[group]
+        end_time = self.group_end[group]
+        busy_time_space = self.interviewer_busy_time_space.get(interviewer)
+        if busy_time_space is None:
+            return ALL_ROOMS
+        rooms = set()
+        for busy_start, busy_end, busy_room in busy_time_space.overlapping(start_time,
+            end_time, self.travel_time):
+            if busy_start < end_time and busy_end > start_time:
+                return None
+            if (busy_room is not None and busy_start - self.travel_time < end_time
+                and busy_end + self.travel_time > start_time):
+                rooms.add(busy_room)
+        if len(rooms) > 1:
+            return None
+        self.stats.break_checks += 1
+        if self.interviewer_work_runs[interviewer].continuous_work_with(start_time,
+            end_time) > self.max_continuous_work:
+            return None
+        return rooms.pop() if rooms else ALL_ROOMS
+
+    def available_interviewers(self, interview_slot):
+        # The interviewers able to take the slot, as a bitset
+        group = self.slot_group[interview_slot]
+        return self.group_available[group] | self.group_room_available[group].get(
+            self.slot_room[interview_slot], 0)
+
+    def interviewer_can_take(self, interviewer, interview_slot):
+        # Looks the interviewer up in the bitsets, see available_rooms
+        return bool(self.available_interviewers(interview_slot) >> interviewer & 1)
+
+    @property
+    def available_interview_slots(self):
+        return np.flatnonzero(self.slot_is_free).tolist()
 
     def applicant_is_available(self, applicant, interview_slot):
-        if self.applicant_busy_times.get(applicant.id) is None:
-            return True
-        for busy_time_start, busy_time_end in self.applicant_busy_times.get(applicant.id):
-            if (busy_time_start < interview_slot.end_time and
-                busy_time_end > interview_slot.start_time):
-                return False
-        return True
-
-    def interviewer_is_available(self, interviewer, interview_slot):
-        start_time = interview_slot.start_time
-        end_time = interview_slot.end_time
-        busy_time_space = self.interviewer_busy_time_space.get(interviewer.id)
-        if busy_time_space is None:
-            return True
-        for busy_time_start, busy_time_end, busy_room in busy_time_space:
-            if busy_room == interview_slot.room or busy_room is None:
-                if busy_time_start < end_time and busy_time_end > start_time:
-                    return False
-            else:
-                if (busy_time_start - TRAVEL_TIME < end_time and
-                    busy_time_end + TRAVEL_TIME > start_time):
-                    return False
-        if not sufficient_breaks_exist(busy_time_space, interview_slot):
-            return False
-        return True
-
-    def get_available_interviewer(self, job, interview_slot, taken_interviewers=[], max_priority=3):
-        interviewer_lists = [job.possible_interviewers_1, job.possible_interviewers_2,
-            job.possible_interviewers_3]
-        for interviewer_list_object in interviewer_lists[:max_priority]:
-            interviewer_list = interviewer_list_object.all()
-            # Random order to even out amount of interviews per interviewer
-            random_range = list(range(len(interviewer_list)))
-            random.shuffle(random_range)
-            for i in random_range:
-                interviewer = interviewer_list[i]
-                if (self.interviewer_is_available(interviewer, interview_slot)
-                    and interviewer not in taken_interviewers):
-                    return interviewer
+        return self.applicant_slot_available[applicant, interview_slot]
+
+    def get_available_interviewer(self, job, interview_slot, taken_interviewers=(), max_priority=3):
+        available = self.available_interviewers(interview_slot)
+        for interviewer in taken_interviewers:
+            available &= ~(1 << interviewer)
+        for pool_mask in self.job_pool_masks[job][:max_priority]:
+            candidates = available & pool_mask
+            if candidates:
+                # Random choice to even out amount of interviews per interviewer
+                return random_bit(candidates)
         return False
 
     def get_available_interviewers(self, jobs, interview_slot, priority_level=3):
         # Should be at least two interviewers and at least one interviewer from each job
         interviewers = set()
         for job in jobs:
-            max_priority = 1 if job.include_priority_1_interviewer else priority_level
+            max_priority = 1 if self.problem.job_include_priority_1[job] else priority_level
             interviewer = self.get_available_interviewer(job, interview_slot,
                 max_priority=max_priority)
-            if interviewer != False:
+            if interviewer is not False:
                 interviewers.add(interviewer)
             else:
                 return False
         if len(interviewers) >= 2:
-            return interviewers
+            return frozenset(interviewers)
         # Need at least two interviewers, add one more that is different from the other
-        jobs_shuffled = jobs.copy()
+        jobs_shuffled = list(jobs)
         random.shuffle(jobs_shuffled)
         for job in jobs_shuffled:
             interviewer = self.get_available_interviewer(job, interview_slot,
                 taken_interviewers=interviewers)
-            if interviewer != False:
+            if interviewer is not False:
                 interviewers.add(interviewer)
-                return interviewers
+                return frozenset(interviewers)
         # Couldn't find available interviewers for this interview slot
         return False
 
@@ -145,38 +327,87 @@ class Scheduler:
         If priority_level is n, each interview must have at least one interviewer
         with priority n for each job.
         """
+        self.stats.create_interview_calls += 1
         jobs = self.applied_jobs[applicant]
-        # It's nice to fill up the early interview slots first
-        available_interview_slots_sorted = list(self.available_interview_slots)
-        available_interview_slots_sorted.sort(key=lambda x : (x.room.id, x.start_time))
-        for interview_slot in available_interview_slots_sorted:
-            if self.applicant_is_available(applicant, interview_slot):
-                interviewers = self.get_available_interviewers(jobs, interview_slot,
-                    priority_level)
-                if interviewers != False:
-                    self.add_interview(applicant, interviewers, interview_slot)
-                    return True
+        # Free slots the applicant is available at, in the order they should be filled
+        candidate_slots = np.flatnonzero(
+            self.applicant_slot_available[applicant] & self.slot_is_free).tolist()
+        slots_probed = self.stats.slots_probed
+        job_day_version = self.job_day_version
+        for interview_slot in candidate_slots:
+            day = self.slot_start[interview_slot] // DAY
+            job_versions = tuple(job_day_version.get((job, day), 0) for job in jobs)
+            failed_probe = self.failed_probes.get((applicant, interview_slot))
+            if (failed_probe is not None and failed_probe[0] >= priority_level
+                and failed_probe[1] == job_versions):
+                self.stats.failed_probe_cache_hits += 1
+                continue
+            slots_probed[applicant] = slots_probed.get(applicant, 0) + 1
+            interviewers = self.get_available_interviewers(jobs, interview_slot, priority_level)
+            if interviewers != False:
+                self.add_interview(applicant, interviewers, interview_slot)
+                return True
+            self.failed_probes[(applicant, interview_slot)] = (priority_level, job_versions)
         return False
 
     def take_interview_and_reschedule(self, applicant):
+        # Tries to place the applicant in a taken slot by moving other applicants, see
+        # RESCHEDULE_DEPTH. Returns True if the applicant got an interview.
+        if self.move_and_place(applicant, self.reschedule_depth, {applicant}, None):
+            self.stats.reschedule_successes += 1
+            # The schedule has changed, so failed moves may succeed now
+            self.failed_moves.clear()
+            return True
+        return False
+
+    def move_and_place(self, applicant, depth, chain, breadth):
+        """
+        Places the applicant in a taken slot, moving the applicant of that interview to a free
+        slot or, with depth left, recursively to another taken slot. Applicants in chain are
+        not moved again, and at most breadth taken slots are tried. Returns True if the
+        applicant was placed, and otherwise leaves the schedule unchanged.
+        """
         jobs = self.applied_jobs[applicant]
-        for i in range(len(self.interview_list)):
-            interview_slot = self.interview_list[i].interview_slot
-            if self.applicant_is_available(applicant, interview_slot):
-                old_applicant = self.interview_list[i].applicant
-                old_interviewers = self.interview_list[i].interviewers
-                self.remove_interview(i)
-                interviewers = self.get_available_interviewers(jobs, interview_slot)
-                if interviewers != False:
-                    self.add_interview(applicant, interviewers, interview_slot)
-                    old_interview_rescheduled = self.create_interview(old_applicant)
-                    if old_interview_rescheduled:
-                        return
-                    else:
-                        self.remove_interview(-1)
-                self.add_interview(old_applicant, old_interviewers, interview_slot, i)
-
-    def schedule_interviews(self, silent=True):
+        taken_slots = np.flatnonzero(
+            self.applicant_slot_available[applicant] & ~self.slot_is_free).tolist()
+        tried = 0
+        for interview_slot in taken_slots:
+            if breadth is not None and tried == breadth:
+                break
+            interview = self.slot_interview[interview_slot]
+            old_applicant = interview.applicant
+            if (old_applicant in chain
+                or self.failed_moves.get((old_applicant, interview_slot), 0) >= depth):
+                continue
+            tried += 1
+            self.stats.reschedule_attempts += 1
+            index = self.slot_index[interview_slot]
+            self.remove_interview(index)
+            interviewers = self.get_available_interviewers(jobs, interview_slot)
+            if interviewers != False:
+                self.add_interview(applicant, interviewers, interview_slot)
+                if self.create_interview(old_applicant) or (depth > 1 and self.move_and_place(
+                    old_applicant, depth - 1, chain | {old_applicant}, self.reschedule_breadth)):
+                    return True
+                self.remove_interview(len(self.interviews) - 1)
+                self.failed_moves[(old_applicant, interview_slot)] = depth
+            self.add_interview(old_applicant, interview.interviewers, interview_slot, index)
+        return False
+
+    def schedule_interviews(self, silent=True, validate=True, improve_seconds=0):
+        self.first_pass(silent)
+        self.second_pass(silent)
+        if improve_seconds > 0:
+            self.improve(improve_seconds)
+        # Just to be sure, assert that the produced interview list is valid
+        if validate:
+            self.validate()
+
+    def first_pass(self, silent=True):
+        with self.stats.phase("pass_1"):
+            self._first_pass(silent)
+
+    def _first_pass(self, silent):
         # First, schedule interviews naively
         applicants_to_allocate = set(self.unallocated_applicants)
         counter = 0
@@ -191,6 +422,12 @@ class Scheduler:
             if not silent:
                 counter += 1
                 print(f"Progress: 1/2: {(100*counter)//counter_max} %")
+
+    def second_pass(self, silent=True):
+        with self.stats.phase("pass_2"):
+            self._second_pass(silent)
+
+    def _second_pass(self, silent):
         # Try to schedule interviews for unallocated applicants by rescheduling other interviews
         applicants_to_allocate = set(self.unallocated_applicants)
         counter = 0
@@ -200,18 +437,125 @@ class Scheduler:
             if not silent:
                 counter += 1
                 print(f"Progress: 2/2: {(100*counter)//counter_max} %")
-        # Just to be sure, assert that the produced interview list is valid
-        assert_interview_list_is_valid(self.interview_list)
-
-    def save_scheduled_interviews(self):
-        for interview in self.interview_list:
-            for interviewer in interview.interviewers:
-                interview.interview_slot.interviewers.add(interviewer)
-            for application in self.applications[interview.applicant]:
-                application.interview_slot = interview.interview_slot
-                application.save()
-            interview.interview_slot.save()
 
+    def improve(self, seconds):
+        # Improves the schedule by local search for at most seconds, see improve.py
+        with self.stats.phase("improve"):
+            improver = Improver(self)
+            self.stats.improve_cost_before = improver.cost()
+            improver.run(seconds)
+            self.stats.improve_cost_after = improver.cost()
+            self.stats.improve_moves_evaluated += improver.moves_evaluated
+            self.stats.improve_moves_applied += improver.moves_applied
+
+    def find_violations(self):
+        # Returns a list of the Violations of the scheduling rules by self.interviews
+        return find_violations(self.problem, self.interviews, self.travel_time,
+            self.max_continuous_work, self.break_length, self.job_pools)
+
+    def validate(self):
+        with self.stats.phase("validate"):
+            assert_no_violations(self.problem, self.find_violations())
+
+    def interview_pks(self):
+        # Returns (slot pk, interviewer pks, application pks) for each interview
+        slot_pks = self.problem.slot_pks.tolist()
+        interviewer_pks = self.problem.interviewer_pks.tolist()
+        return [(slot_pks[interview.interview_slot],
+            sorted(interviewer_pks[interviewer] for interviewer in interview.interviewers),
+            list(self.problem.application_pks[interview.applicant]))
+            for interview in self.interviews]
+
+    def save_scheduled_interviews(self, batch_size=500):
+        # Writes all interviews to the database in one transaction. Returns the number of rows
+        # written and the elapsed time in seconds.
+        started = time.perf_counter()
+        rows_written = save_interviews(self.interview_pks(), batch_size)
+        return rows_written, time.perf_counter() - started
+
+def save_interviews(interview_pks, batch_size=500):
+    # Writes interviews given as (slot pk, interviewer pks, application pks) to the database in
+    # one transaction, and returns the number of rows written
+    SlotInterviewer = InterviewSlot.interviewers.through
+    applications = []
+    slot_interviewers = []
+    for slot_pk, interviewer_pks, application_pks in interview_pks:
+        for application_pk in application_pks:
+            applications.append(Application(pk=application_pk, interview_slot_id=slot_pk))
+        for interviewer_pk in interviewer_pks:
+            slot_interviewers.append(SlotInterviewer(interviewslot_id=slot_pk,
+                interviewer_id=interviewer_pk))
+    with transaction.atomic():
+        Application.objects.bulk_update(applications, ['interview_slot'],
+            batch_size=batch_size)
+        # Interviewers already added to the slot by hand are kept
+        SlotInterviewer.objects.bulk_create(slot_interviewers, batch_size=batch_size,
+            ignore_conflicts=True)
+    return len(applications) + len(slot_interviewers)
+
+def to_bitsets(available):
+    # Converts a boolean matrix (rows x interview slots) to a bitset of rows for each slot
+    packed = np.packbits(available.T, axis=1, bitorder='little')
+    return [int.from_bytes(row.tobytes(), 'little') for row in packed]
+
+def from_bitsets(bitsets, num_rows):
+    # Converts bitsets of rows to a boolean matrix (rows x bitsets), the inverse of to_bitsets
+    num_bytes = (num_rows + 7) // 8
+    mask = (1 << num_rows) - 1
+    packed = np.frombuffer(b"".join((bitset & mask).to_bytes(num_bytes, 'little')
+        for bitset in bitsets), dtype=np.uint8).reshape(len(bitsets), num_bytes)
+    return np.unpackbits(packed, axis=1, count=num_rows, bitorder='little').T.astype(bool)
+
+def random_bit(bitset):
+    # Returns the index of a random set bit of a nonzero bitset
+    for _ in range(random.randrange(bitset.bit_count())):
+        bitset &= bitset - 1
+    return (bitset & -bitset).bit_length() - 1
+
+def get_applicant_availability(problem, chunk_size=2**22):
+    # Returns a boolean matrix (applicants x interview slots), which is True where the
+    # applicant isn't busy during the interview slot
+    return get_availability(problem, problem.num_applicants, problem.applicant_busy_applicant,
+        problem.applicant_busy_start, problem.applicant_busy_end, chunk_size=chunk_size)
+
+def get_interviewer_availability(problem, travel_time, chunk_size=2**22):
+    # Returns a boolean matrix (interviewers x interview slots), which is True where the
+    # interviewer isn't busy during the interview slot, counting travel time to and from
+    # interviews in other rooms. Breaks are not considered.
+    return get_availability(problem, len(problem.interviewer_pks),
+        problem.interviewer_busy_interviewer, problem.interviewer_busy_start,
+        problem.interviewer_busy_end, problem.interviewer_busy_room, travel_time, chunk_size)
+
+def get_availability(problem, num_rows, busy_rows, busy_starts, busy_ends, busy_rooms=None,
+    travel_time=0, chunk_size=2**22):
+    # Busy times with a room other than -1 are padded by travel_time against slots in other
+    # rooms
+    available = np.ones((num_rows, problem.num_slots), dtype=bool)
+    if len(busy_rows) == 0 or problem.num_slots == 0:
+        return available
+    order = np.argsort(busy_rows, kind='stable')
+    busy_rows = busy_rows[order]
+    busy_starts = busy_starts[order]
+    busy_ends = busy_ends[order]
+    if busy_rooms is not None:
+        busy_rooms = busy_rooms[order]
+    slot_starts = problem.slot_start
+    slot_ends = problem.slot_end
+    # Compare a chunk of busy times against all slots at a time to bound memory use
+    step = max(1, chunk_size // problem.num_slots)
+    for i in range(0, len(busy_rows), step):
+        rows = busy_rows[i:i+step]
+        padding = 0
+        if busy_rooms is not None:
+            rooms = busy_rooms[i:i+step, None]
+            padding = np.where((rooms != -1) & (rooms != problem.slot_room[None, :]),
+                travel_time, 0)
+        overlaps = ((busy_starts[i:i+step, None] - padding < slot_ends[None, :]) &
+            (busy_ends[i:i+step, None] + padding > slot_starts[None, :]))
+        # Combine the busy times of each row in the chunk (rows are sorted)
+        first = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        available[rows[first]] &= ~np.logical_or.reduceat(overlaps, first, axis=0)
+    return available
 
 def get_busy_times():
     applicant_busy_times = {}
@@ -234,177 +578,61 @@ def get_busy_times():
 def get_applications():
     applied_jobs = {}
     applications_to_allocate = Application.objects.filter(
-        interview_slot=None, withdrawn=False).select_related(
-        'applicant', 'job').prefetch_related('job__possible_interviewers_1',
-        'job__possible_interviewers_2', 'job__possible_interviewers_3')
+        interview_slot=None, withdrawn=False).select_related('applicant', 'job')
     for application in applications_to_allocate:
         applied_jobs.setdefault(application.applicant, []).append(application)
     return applied_jobs
 
-def sufficient_breaks_exist(busy_times, interview_slot):
-    # Returns True if interviewer has breaks sufficiently close to the interview both before and after
-    start = interview_slot.start_time
-    end = interview_slot.end_time
-    time_lower_limit = start - MAX_CONTINUOUS_WORK
-    time_upper_limit = end + MAX_CONTINUOUS_WORK
-
-    work_times = [
-        (work_start, work_end) for work_start, work_end, room in busy_times
-        if room is not None # means the busy time is an interview
-        and work_end > time_lower_limit
-        and work_start < time_upper_limit
-    ]
-    work_times.append((start, end))
-    work_times.sort()
-    return _sufficient_breaks_exist(work_times)
-
-def _sufficient_breaks_exist(work_times_sorted):
-    # Returns False if work_times_sorted violates the sufficient break requirement
-    prev_work_end = datetime.datetime.min
-    longest_cts_work = datetime.timedelta(0)
-    for work_start, work_end in work_times_sorted:
-        if work_start >= prev_work_end + BREAK_LENGTH:
-            longest_cts_work = work_end - work_start
-        else:
-            longest_cts_work += work_end - prev_work_end
-        if longest_cts_work > MAX_CONTINUOUS_WORK:
-            return False
-        prev_work_end = work_end
-    return True
-
 # Functions for checking database before scheduling interviews
 
 def assert_one_interview_slot_per_room_per_time():
     # This function checks if someone has added overlapping interview slots to the database
-    interview_slots = InterviewSlot.objects.all()
-    time_slots_for_room = {}
-    for interview_slot in interview_slots:
-        time_slots_for_room.setdefault(interview_slot.room, []).append(
-            (interview_slot.start_time, interview_slot.end_time))
-    for room, time_slots in time_slots_for_room.items():
-        time_slots_sorted = sorted(time_slots)
-        for i in range(len(time_slots_sorted) - 1):
-            assert time_slots[i][1] <= time_slots[i+1][0], (
-                "The database contains overlapping interview slots for the same room. You need to "
-                + "clean this up manually before you can run the scheduler.")
+    overlapping_interview_slots = get_overlapping_interview_slots()
+    assert not overlapping_interview_slots, (
+        "The database contains overlapping interview slots for the same room. You need to "
+        + "clean this up manually before you can run the scheduler. Overlapping slots: "
+        + ", ".join(f"{first_pk} and {second_pk}"
+        for first_pk, second_pk in overlapping_interview_slots))
+
+def get_overlapping_interview_slots():
+    # Returns (earlier slot pk, later slot pk) pairs of interview slots in the same room where
+    # the later slot starts before the latest end of the slots before it in the room, paired
+    # with the slot that ends latest. Any overlap in a room makes at least one such pair. Uses
+    # one query.
+    order_by = [F('start_time').asc(), F('end_time').asc(), F('id').asc()]
+    interview_slots = InterviewSlot.objects.order_by('room_id', *order_by)
+    if connection.features.supports_over_clause:
+        # Only the slots that overlap a slot before or after them are fetched. A slot ending
+        # latest before an overlapping slot overlaps the next slot, so it is one of them.
+        interview_slots = interview_slots.annotate(
+            previous_end_time=Window(Max('end_time'), partition_by=F('room_id'),
+                order_by=order_by, frame=RowRange(None, -1)),
+            next_start_time=Window(Lead('start_time'), partition_by=F('room_id'),
+                order_by=order_by)).filter(Q(previous_end_time__gt=F('start_time'))
+            | Q(next_start_time__lt=F('end_time')))
+    overlapping_interview_slots = []
+    previous_room_pk = latest_pk = latest_end_time = None
+    for pk, room_pk, start_time, end_time in interview_slots.values_list('id', 'room_id',
+        'start_time', 'end_time'):
+        if room_pk != previous_room_pk:
+            previous_room_pk, latest_pk, latest_end_time = room_pk, pk, end_time
+            continue
+        if start_time < latest_end_time:
+            overlapping_interview_slots.append((latest_pk, pk))
+        if end_time > latest_end_time:
+            latest_pk, latest_end_time = pk, end_time
+    return overlapping_interview_slots
 
 # Functions for validating interview list correctness after scheduling interviews
 
 def assert_interview_list_is_valid(interview_list):
-    assert_at_least_two_interviewers(interview_list)
-    assert_applied_jobs_represented_in_interviews(interview_list)
-    assert_priority_1_interviewers_when_required(interview_list)
-    assert_applicants_available_at_time(interview_list)
-    assert_interviewers_available_at_time(interview_list)
-    assert_at_most_one_interview_per_interview_slot(interview_list)
-    assert_at_most_one_interview_per_interviewer_per_time(interview_list)
-    assert_at_most_one_interview_per_applicant(interview_list)
-    assert_sufficient_travel_time_and_breaks_for_interviewers(interview_list)
-
-def assert_at_least_two_interviewers(interview_list):
-    for interview in interview_list:
-        assert len(interview.interviewers) >= 2
-
-def assert_applied_jobs_represented_in_interviews(interview_list):
-    applications = get_applications()
-    for interview in interview_list:
-        for application in applications[interview.applicant]:
-            job = application.job
-            assert sum(interviewer in set().union(job.possible_interviewers_1.all(),
-                    job.possible_interviewers_2.all(), job.possible_interviewers_3.all())
-                for interviewer in interview.interviewers) > 0
-
-def assert_priority_1_interviewers_when_required(interview_list):
-    applications = get_applications()
-    for interview in interview_list:
-        for application in applications[interview.applicant]:
-            if application.job.include_priority_1_interviewer:
-                assert sum(interviewer in application.job.possible_interviewers_1.all()
-                    for interviewer in interview.interviewers) > 0
-
-def assert_applicants_available_at_time(interview_list):
-    applicant_busy_times, _ = get_busy_times()
-    for interview in interview_list:
-        for busy_time_start, busy_time_end in (
-            applicant_busy_times.get(interview.applicant.id) or []):
-            assert (busy_time_start >= interview.interview_slot.end_time or
-                busy_time_end <= interview.interview_slot.start_time)
-
-def assert_interviewers_available_at_time(interview_list):
-    _, interviewer_busy_time_space = get_busy_times()
-    for interview in interview_list:
-        for interviewer in interview.interviewers:
-            for busy_time_start, busy_time_end, _ in (
-                interviewer_busy_time_space.get(interviewer.id) or []):
-                assert (busy_time_start >= interview.interview_slot.end_time or
-                    busy_time_end <= interview.interview_slot.start_time)
-
-def assert_at_most_one_interview_per_interview_slot(interview_list):
-    interview_slots = [interview.interview_slot for interview in interview_list]
-    assert len(interview_slots) == len(set(interview_slots))
-
-def assert_at_most_one_interview_per_interviewer_per_time(interview_list):
-    time_slots_for_interviewer = {}
-    for interview in interview_list:
-        for interviewer in interview.interviewers:
-            time_slots_for_interviewer.setdefault(interviewer, []).append(
-                (interview.interview_slot.start_time, interview.interview_slot.end_time))
-    for _, time_slots in time_slots_for_interviewer.items():
-        time_slots_sorted = sorted(time_slots)
-        for i in range(len(time_slots_sorted) - 1):
-            first_interview_end = time_slots_sorted[i][1]
-            second_interview_start = time_slots_sorted[i+1][0]
-            assert first_interview_end <= second_interview_start
-
-def assert_sufficient_travel_time_and_breaks_for_interviewers(interview_list):
-    time_space_slots_for_interviewer = {}
-    for interview in interview_list:
-        interview_slot = interview.interview_slot
-        for interviewer in interview.interviewers:
-            time_space_slots_for_interviewer.setdefault(interviewer, []).append(
-                (interview_slot.start_time, interview_slot.end_time, interview_slot.room, False))
-    _, interviewer_busy_time_space = get_busy_times()
-    for interviewer, busy_time_space in interviewer_busy_time_space.items():
-        for start_time, end_time, room in busy_time_space:
-            if room is not None:
-                time_space_slots_for_interviewer.setdefault(interviewer, []).append(
-                    (start_time, end_time, room, True))
-    assert_sufficient_travel_time_for_interviewers(time_space_slots_for_interviewer)
-    assert_sufficient_breaks_for_interviewers(time_space_slots_for_interviewer)
-
-def assert_at_most_one_interview_per_applicant(interview_list):
-    applicants = [interview.applicant for interview in interview_list]
-    assert len(applicants) == len(set(applicants))
-
-def assert_sufficient_travel_time_for_interviewers(time_space_slots_for_interviewer):
-    for _, time_space_slots in time_space_slots_for_interviewer.items():
-        time_space_slots_sorted = sorted(time_space_slots)
-        for i in range(len(time_space_slots_sorted) - 1):
-            if time_space_slots_sorted[i][3] and time_space_slots_sorted[i+1][3]:
-                # Both where created manually
-                continue
-            if time_space_slots_sorted[i][2] == time_space_slots_sorted[i+1][2]:
-                # The same room, no travel time needed
-                continue
-            first_interview_end = time_space_slots_sorted[i][1]
-            second_interview_start = time_space_slots_sorted[i+1][0]
-            assert first_interview_end + TRAVEL_TIME <= second_interview_start
-
-def assert_sufficient_breaks_for_interviewers(time_space_slots_for_interviewer):
-    for _, time_space_slots in time_space_slots_for_interviewer.items():
-        time_space_slots_sorted = sorted(time_space_slots)
-        time_without_breaks = 0
-        last_interview_end = None
-        for i in range(len(time_space_slots_sorted)):
-            if time_space_slots_sorted[i][3]:
-                # The busy time is not an interview
-                continue
-            interview_start = time_space_slots_sorted[i][0]
-            interview_end = time_space_slots_sorted[i][1]
-            if (last_interview_end is None
-                or interview_start >= last_interview_end + BREAK_LENGTH):
-                time_without_breaks = interview_end - interview_start
-            else:
-                time_without_breaks += interview_end - last_interview_end
-            assert time_without_breaks <= MAX_CONTINUOUS_WORK
-            last_interview_end = interview_end
+    # Validates Interview objects with model instances against the database. The scheduler
+    # validates its own interviews with Scheduler.validate, without querying the database.
+    problem = Problem.from_database()
+    assert_no_violations(problem, find_violations(problem,
+        problem.compile_interviews(interview_list), TRAVEL_TIME // MINUTE,
+        MAX_CONTINUOUS_WORK // MINUTE, BREAK_LENGTH // MINUTE))
+
+def assert_no_violations(problem, violations):
+    assert not violations, "The interview list is not valid:\n" + "\n".join(
+        violation.describe(problem) for violation in violations)
@@ -0,0 +1,68 @@
+# BIPS: Counters and timers for profiling the scheduler
+
+import time
+from contextlib import contextmanager
+
+
+class SchedulerStats:
+    """
+    Counts calls on the scheduler's hot paths and times each scheduling phase. A Scheduler
+    keeps one in self.stats.
+    """
+
+    def __init__(self):
+        # Interviewer availability rechecks at a time group, after a booking or release nearby
+        self.group_rechecks = 0
+        # Rechecks that got as far as checking the interviewer's breaks
+        self.break_checks = 0
+        self.create_interview_calls = 0
+        # Number of free slots tried by create_interview, for each applicant
+        self.slots_probed = {}
+        # Slots skipped by create_interview because no interviewers were found there before
+        self.failed_probe_cache_hits = 0
+        self.reschedule_attempts = 0
+        self.reschedule_successes = 0
+        # Local search after scheduling, see improve.py
+        self.improve_moves_evaluated = 0
+        self.improve_moves_applied = 0
+        self.improve_cost_before = None
+        self.improve_cost_after = None
+        self.phase_seconds = {}
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_seconds[name] = (self.phase_seconds.get(name, 0)
+                + time.perf_counter() - started)
+
+    def as_dict(self):
+        slots_probed = list(self.slots_probed.values())
+        return {
+            "group_rechecks": self.group_rechecks,
+            "break_checks": self.break_checks,
+            "create_interview_calls": self.create_interview_calls,
+            "slots_probed": sum(slots_probed),
+            "slots_probed_per_applicant_mean": (round(sum(slots_probed) / len(slots_probed), 2)
+                if slots_probed else 0),
+            "slots_probed_per_applicant_max": max(slots_probed, default=0),
+            "failed_probe_cache_hits": self.failed_probe_cache_hits,
+            "reschedule_attempts": self.reschedule_attempts,
+            "reschedule_successes": self.reschedule_successes,
+            "improve_moves_evaluated": self.improve_moves_evaluated,
+            "improve_moves_applied": self.improve_moves_applied,
+            "improve_cost_before": self.improve_cost_before,
+            "improve_cost_after": self.improve_cost_after,
+            "phase_seconds": {phase: round(seconds, 4)
+                for phase, seconds in self.phase_seconds.items()},
+        }
+
+    def print_report(self):
+        for name, value in self.as_dict().items():
+            if name == "phase_seconds":
+                for phase, seconds in value.items():
+                    print(f"  {phase} phase: {seconds:.2f} s")
+            else:
+                print(f"  {name.replace('_', ' ').capitalize()}: {value}")
@@ -1,13 +1,46 @@
-from datetime import datetime
-from django.test import TestCase
+import contextlib
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import datetime, timedelta
+from unittest import mock
+import numpy as np
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
 
-from .scheduler import Scheduler, Interview, get_applications, get_busy_times, assert_one_interview_slot_per_room_per_time, assert_interview_list_is_valid
+from .benchmark import PHASES, generate_problem, run_benchmark
+from .intervals import BusyTimeIndex, WorkRuns
+from .improve import Improver
+from .parallel import count_interviews_without_priority_1, schedule_with_seeds
+from .problem import Problem, get_interviewer_pools, to_minutes
+from .matching import MatchingScheduler
+from .scheduler import Scheduler, Interview, get_applicant_availability, get_interviewer_availability, get_applications, get_busy_times, assert_one_interview_slot_per_room_per_time, assert_interview_list_is_valid, get_overlapping_interview_slots
+from .validation import Violation, find_interviewer_violations
+from .models import Applicant, Application, BusyTime, InterviewSlot, Job, Room
 from .factory_f import ApplicantFactory, ApplicationFactory, BusyTimeFactory, InterviewSlotFactory, JobFactory, RoomFactory, InterviewerFactory
 
 # Tests for automatic interview scheduling
 # Run with python manage.py test (in root folder)
 
 
+def minutes(*args):
+    return to_minutes(datetime(*args))
+
+def applicant_id(scheduler, applicant):
+    return scheduler.problem.applicant_pks.tolist().index(applicant.id)
+
+def add_interview(scheduler, applicant, interviewers, interview_slot):
+    # Adds an interview given by model instances to the scheduler
+    interview = scheduler.problem.compile_interviews(
+        [Interview(applicant, interviewers, interview_slot)])[0]
+    scheduler.add_interview(interview.applicant, interview.interviewers, interview.interview_slot)
+
+
 class BasicBipsTest(TestCase):
     def setUp(self):
         # Insert test stuff in the test database
@@ -47,31 +80,114 @@ class BasicBipsTest(TestCase):
         )
         self.assertEqual(get_busy_times(), busy_times)
 
+    def test_get_interviewer_pools(self):
+        self.interviewer3 = InterviewerFactory()
+        self.job1.possible_interviewers_3.add(self.interviewer3)
+        pool = get_interviewer_pools()[self.job1.id]
+        self.assertEqual(pool.by_priority,
+            ((self.interviewer1.id, self.interviewer2.id), (), (self.interviewer3.id,)))
+        self.assertEqual(pool.priority_1, {self.interviewer1.id, self.interviewer2.id})
+        self.assertEqual(pool.all,
+            {self.interviewer1.id, self.interviewer2.id, self.interviewer3.id})
+
     def test_schedule_interviews(self):
         self.scheduler.schedule_interviews()
         interview_list = [Interview(self.applicant1, {self.interviewer2, self.interviewer1},
             self.interview_slot1)]
         self.assertEqual(self.scheduler.interview_list, interview_list)
 
+    def test_scheduler_stats(self):
+        self.scheduler.schedule_interviews()
+        stats = self.scheduler.stats.as_dict()
+        self.assertEqual(stats["create_interview_calls"], 1)
+        self.assertEqual(stats["slots_probed"], 1)
+        self.assertGreaterEqual(stats["group_rechecks"], 2)
+        self.assertGreaterEqual(stats["group_rechecks"], stats["break_checks"])
+        self.assertEqual(stats["reschedule_attempts"], 0)
+        self.assertEqual(list(stats["phase_seconds"]), ["load", "pass_1", "pass_2", "validate"])
+
     def test_busy_times_are_updated(self):
         # Test that generated interviews are added to stored as busy-time-spaces for interviewers
-        self.scheduler.add_interview(self.applicant1, {self.interviewer1, self.interviewer2},
+        add_interview(self.scheduler, self.applicant1, {self.interviewer1, self.interviewer2},
             self.interview_slot1)
-        busy_time_space = {(self.interview_slot1.start_time, self.interview_slot1.end_time,
-            self.interview_slot1.room)}
-        interviewer_busy_time_space = {
-            self.interviewer1.id: busy_time_space,
-            self.interviewer2.id: busy_time_space
-        }
-        self.assertEqual(self.scheduler.interviewer_busy_time_space, interviewer_busy_time_space)
+        busy_time_space = {(to_minutes(self.interview_slot1.start_time),
+            to_minutes(self.interview_slot1.end_time), 0)}
+        interviewer_busy_time_space = {0: busy_time_space, 1: busy_time_space}
+        self.assertEqual({interviewer: set(busy_times) for interviewer, busy_times
+            in self.scheduler.interviewer_busy_time_space.items()}, interviewer_busy_time_space)
 
     def test_save_scheduled_interviews(self):
         self.scheduler.schedule_interviews()
         interview_list = [Interview(self.applicant1, {self.interviewer2, self.interviewer1},
             self.interview_slot1)]
         self.assertEqual(self.scheduler.interview_list, interview_list)
-        self.scheduler.save_scheduled_interviews()
+        rows_written, _ = self.scheduler.save_scheduled_interviews()
+        self.assertEqual(rows_written, 3)
         self.assertEqual(get_applications(), {})
+        self.assertCountEqual(self.interview_slot1.interviewers.all(),
+            [self.interviewer1, self.interviewer2])
+        self.application1.refresh_from_db()
+        self.assertEqual(self.application1.interview_slot, self.interview_slot1)
+
+
+class BipsFreeSlotIndexTest(TestCase):
+    def setUp(self):
+        self.interviewer1 = InterviewerFactory()
+        self.interviewer2 = InterviewerFactory()
+        self.applicant1 = ApplicantFactory()
+        self.job1 = JobFactory()
+        self.application1 = ApplicationFactory(applicant=self.applicant1, job=self.job1)
+        self.room1 = RoomFactory()
+        self.room2 = RoomFactory()
+        self.interview_slot1 = InterviewSlotFactory(room=self.room2,
+            start_time=datetime(2020,6,21,10,0), end_time=datetime(2020,6,21,10,30))
+        self.interview_slot2 = InterviewSlotFactory(room=self.room1,
+            start_time=datetime(2020,6,21,11,0), end_time=datetime(2020,6,21,11,30))
+        self.interview_slot3 = InterviewSlotFactory(room=self.room1,
+            start_time=datetime(2020,6,21,10,0), end_time=datetime(2020,6,21,10,30))
+        self.scheduler = Scheduler()
+
+    def test_free_slots_ordered_by_room_and_time(self):
+        self.assertEqual(self.scheduler.problem.slot_pks.tolist(), [self.interview_slot3.id,
+            self.interview_slot2.id, self.interview_slot1.id])
+        self.assertEqual(self.scheduler.available_interview_slots, [0, 1, 2])
+
+    def test_free_slots_updated_by_add_and_remove(self):
+        add_interview(self.scheduler, self.applicant1, {self.interviewer1, self.interviewer2},
+            self.interview_slot2)
+        self.assertEqual(self.scheduler.available_interview_slots, [0, 2])
+        self.scheduler.remove_interview(0)
+        self.assertEqual(self.scheduler.available_interview_slots, [0, 1, 2])
+
+
+class BipsApplicantAvailabilityTest(TestCase):
+    def setUp(self):
+        self.room1 = RoomFactory()
+        self.interview_slots = [InterviewSlotFactory(room=self.room1,
+            start_time=datetime(2020,6,21,hour), end_time=datetime(2020,6,21,hour,30))
+            for hour in range(9, 13)]
+        self.job1 = JobFactory()
+        self.applicants = [ApplicantFactory() for _ in range(3)]
+        for applicant in self.applicants:
+            ApplicationFactory(applicant=applicant, job=self.job1)
+        BusyTimeFactory(applicant=self.applicants[0],
+            begin=datetime(2020,6,21,9), end=datetime(2020,6,21,10))
+        BusyTimeFactory(applicant=self.applicants[0],
+            begin=datetime(2020,6,21,11,15), end=datetime(2020,6,21,12,15))
+        BusyTimeFactory(applicant=self.applicants[1],
+            begin=datetime(2020,6,21,10,30), end=datetime(2020,6,21,11))
+        # Busy times of applicants without applications are ignored
+        BusyTimeFactory(applicant=ApplicantFactory(),
+            begin=datetime(2020,6,21,9), end=datetime(2020,6,21,12))
+
+    def test_get_applicant_availability(self):
+        problem = Problem.from_database()
+        expected = [[False, True, False, False], [True, True, True, True],
+            [True, True, True, True]]
+        # A small chunk size splits the busy times of an applicant between chunks
+        for chunk_size in (1, 4, 2**22):
+            available = get_applicant_availability(problem, chunk_size)
+            self.assertEqual(available.tolist(), expected)
 
 
 class BipsCreateTest(TestCase):
@@ -103,14 +219,15 @@ class BipsCreateTest(TestCase):
         self.scheduler = Scheduler()
 
     def test_create_interview(self):
-        created = self.scheduler.create_interview(self.applicant1)
+        created = self.scheduler.create_interview(applicant_id(self.scheduler, self.applicant1))
         self.assertTrue(created)
         interview_list = [Interview(self.applicant1, {self.interviewer1, self.interviewer2},
             self.interview_slot1)]
         self.assertEqual(self.scheduler.interview_list, interview_list)
 
     def test_create_interview_priority_1_success(self):
-        created = self.scheduler.create_interview(self.applicant1, priority_level=1)
+        created = self.scheduler.create_interview(applicant_id(self.scheduler, self.applicant1),
+            priority_level=1)
         self.assertTrue(created)
         interview_list = [Interview(self.applicant1, {self.interviewer2, self.interviewer1},
             self.interview_slot1)]
@@ -118,13 +235,14 @@ class BipsCreateTest(TestCase):
 
     def test_create_interview_priority_1_fail(self):
         self.scheduler = Scheduler()
-        created = self.scheduler.create_interview(self.applicant2, priority_level=1)
+        created = self.scheduler.create_interview(applicant_id(self.scheduler, self.applicant2),
+            priority_level=1)
         self.assertFalse(created)
         self.assertEqual(self.scheduler.interview_list, [])
 
     def test_create_interview_three_jobs_two_interviewers(self):
         self.scheduler = Scheduler()
-        created = self.scheduler.create_interview(self.applicant3)
+        created = self.scheduler.create_interview(applicant_id(self.scheduler, self.applicant3))
         self.assertTrue(created)
         interview_list = [Interview(self.applicant3, {self.interviewer1, self.interviewer2},
             self.interview_slot1)]
@@ -153,7 +271,7 @@ class BipsReschedulingTest(TestCase):
             begin=datetime(2020,6,21,10,30), end=datetime(2020,6,21,11,0))
 
         self.scheduler = Scheduler()
-        self.scheduler.add_interview(self.applicant1, {self.interviewer1, self.interviewer2},
+        add_interview(self.scheduler, self.applicant1, {self.interviewer1, self.interviewer2},
             self.interview_slot1)
 
     def test_re_schedule_interviews(self):
@@ -162,6 +280,8 @@ class BipsReschedulingTest(TestCase):
         interview_list = [Interview(self.applicant1, interviewers, self.interview_slot2),
             Interview(self.applicant2, interviewers, self.interview_slot1)]
         self.assertCountEqual(self.scheduler.interview_list, interview_list)
+        self.assertEqual(self.scheduler.slot_index, {interview.interview_slot: index
+            for index, interview in enumerate(self.scheduler.interviews)})
 
 
 class BipsDatabaseValidationTest(TestCase):
@@ -178,6 +298,34 @@ class BipsDatabaseValidationTest(TestCase):
         with self.assertRaises(AssertionError):
             assert_one_interview_slot_per_room_per_time()
 
+    def test_get_overlapping_interview_slots(self):
+        # Slots in other rooms and slots right after each other do not overlap
+        InterviewSlotFactory(start_time=datetime(2020,7,12,10,0),
+            end_time=datetime(2020,7,12,10,30))
+        InterviewSlotFactory(room=self.room1, start_time=datetime(2020,7,12,10,45),
+            end_time=datetime(2020,7,12,11,15))
+        for supports_over_clause in (True, False):
+            with mock.patch.object(connection.features, 'supports_over_clause',
+                supports_over_clause), self.assertNumQueries(1):
+                self.assertEqual(get_overlapping_interview_slots(),
+                    [(self.interview_slot1.pk, self.interview_slot2.pk)])
+
+    def test_slot_overlapping_a_slot_before_the_previous_one(self):
+        # A long slot overlaps both of the slots after it, not only the next one
+        room = RoomFactory()
+        long_slot = InterviewSlotFactory(room=room, start_time=datetime(2020,7,13,9,0),
+            end_time=datetime(2020,7,13,12,0))
+        slot1 = InterviewSlotFactory(room=room, start_time=datetime(2020,7,13,10,0),
+            end_time=datetime(2020,7,13,10,30))
+        slot2 = InterviewSlotFactory(room=room, start_time=datetime(2020,7,13,11,0),
+            end_time=datetime(2020,7,13,11,30))
+        for supports_over_clause in (True, False):
+            with mock.patch.object(connection.features, 'supports_over_clause',
+                supports_over_clause), self.assertNumQueries(1):
+                self.assertEqual(get_overlapping_interview_slots(),
+                    [(self.interview_slot1.pk, self.interview_slot2.pk),
+                    (long_slot.pk, slot1.pk), (long_slot.pk, slot2.pk)])
+
 
 class BipsInterviewListValidationTest(TestCase):
     def setUp(self):
@@ -277,6 +425,30 @@ class BipsInterviewListValidationTest(TestCase):
         with self.assertRaises(AssertionError):
             assert_interview_list_is_valid(interview_list)
 
+    def test_find_violations(self):
+        self.busy_time1 = BusyTimeFactory(interviewer=self.interviewer1,
+            begin=datetime(2020,7,12,10,0), end=datetime(2020,7,12,11,0))
+        self.interview_slot2 = InterviewSlotFactory(start_time=datetime(2020,7,12,10,30),
+            end_time=datetime(2020,7,12,11,0))
+        scheduler = Scheduler()
+        add_interview(scheduler, self.applicant1, {self.interviewer1, self.interviewer2},
+            self.interview_slot1)
+        add_interview(scheduler, self.applicant2, {self.interviewer2}, self.interview_slot2)
+        with self.assertNumQueries(0):
+            violations = scheduler.find_violations()
+        applicant2 = applicant_id(scheduler, self.applicant2)
+        interviewer1, interviewer2 = (scheduler.problem.interviewer_pks.tolist().index(
+            interviewer.id) for interviewer in (self.interviewer1, self.interviewer2))
+        slot1, slot2 = (scheduler.problem.slot_pks.tolist().index(interview_slot.id)
+            for interview_slot in (self.interview_slot1, self.interview_slot2))
+        self.assertCountEqual(violations, [
+            Violation("too_few_interviewers", applicant2, interview_slot=slot2),
+            Violation("interviewer_busy", interviewer=interviewer1, interview_slot=slot1),
+            Violation("insufficient_travel_time", interviewer=interviewer2,
+                interview_slot=slot2)])
+        with self.assertRaises(AssertionError):
+            scheduler.validate()
+
 
 class BipsSimpleSchedulingScenariosTest(TestCase):
     def setUp(self):
@@ -415,3 +587,780 @@ class BipsSufficientBreaksTest(TestCase):
         scheduler = Scheduler()
         scheduler.schedule_interviews()
         self.assertEqual(len(scheduler.interview_list), 2)
+
+
+class BipsMultipleSeedsTest(TestCase):
+    def setUp(self):
+        self.interviewer1 = InterviewerFactory()
+        self.interviewer2 = InterviewerFactory()
+        self.job1 = JobFactory()
+        self.job1.possible_interviewers_1.add(self.interviewer1, self.interviewer2)
+        self.applicant1 = ApplicantFactory()
+        self.application1 = ApplicationFactory(applicant=self.applicant1, job=self.job1)
+        self.interview_slot1 = InterviewSlotFactory()
+
+    def test_schedule_with_seeds(self):
+        scheduler = schedule_with_seeds(Problem.from_database(), range(3), workers=2)
+        self.assertEqual(scheduler.seed, 0)
+        interview_list = [Interview(self.applicant1, {self.interviewer1, self.interviewer2},
+            self.interview_slot1)]
+        self.assertEqual(scheduler.interview_list, interview_list)
+        self.assertEqual(scheduler.unallocated_applicants, set())
+
+
+class BipsMatchingEngineTest(TestCase):
+    def setUp(self):
+        self.interviewer1 = InterviewerFactory()
+        self.interviewer2 = InterviewerFactory()
+        self.job1 = JobFactory()
+        self.job1.possible_interviewers_1.add(self.interviewer1, self.interviewer2)
+        self.room1 = RoomFactory()
+        self.interview_slot1 = InterviewSlotFactory(room=self.room1,
+            start_time=datetime(2020,7,12,10,0), end_time=datetime(2020,7,12,10,30))
+        self.interview_slot2 = InterviewSlotFactory(room=self.room1,
+            start_time=datetime(2020,7,12,11,0), end_time=datetime(2020,7,12,11,30))
+        self.interview_slot3 = InterviewSlotFactory(room=self.room1,
+            start_time=datetime(2020,7,12,12,0), end_time=datetime(2020,7,12,12,30))
+        # The greedy pass gives applicant1 the first slot and applicant2 the second, and
+        # moving applicant1 to make room for applicant3 would also need moving applicant2
+        self.applicant1 = ApplicantFactory()
+        self.applicant2 = ApplicantFactory()
+        self.applicant3 = ApplicantFactory()
+        for applicant, busy_times in ((self.applicant1, [(12, 13)]),
+            (self.applicant2, [(10, 11)]), (self.applicant3, [(11, 13)])):
+            ApplicationFactory(applicant=applicant, job=self.job1)
+            for begin, end in busy_times:
+                BusyTimeFactory(applicant=applicant, begin=datetime(2020,7,12,begin,0),
+                    end=datetime(2020,7,12,end,0))
+
+    def test_greedy_engine(self):
+        # Placing applicant3 takes a chain of two moves
+        scheduler = Scheduler()
+        scheduler.reschedule_depth = 1
+        scheduler.schedule_interviews()
+        self.assertEqual(len(scheduler.interviews), 2)
+        scheduler = Scheduler()
+        scheduler.schedule_interviews()
+        self.assertEqual(len(scheduler.interviews), 3)
+        self.assertEqual(scheduler.stats.reschedule_successes, 1)
+
+    def test_matching_engine(self):
+        scheduler = MatchingScheduler()
+        scheduler.schedule_interviews()
+        interviewers = {self.interviewer1, self.interviewer2}
+        self.assertCountEqual(scheduler.interview_list, [
+            Interview(self.applicant1, interviewers, self.interview_slot2),
+            Interview(self.applicant2, interviewers, self.interview_slot3),
+            Interview(self.applicant3, interviewers, self.interview_slot1)])
+
+    def test_matching_engine_with_seeds(self):
+        scheduler = schedule_with_seeds(Problem.from_database(), range(2), workers=1,
+            engine="matching")
+        self.assertEqual(scheduler.unallocated_applicants, set())
+
+    def test_get_interviewer_availability(self):
+        room2 = RoomFactory()
+        interview_slot4 = InterviewSlotFactory(room=room2,
+            start_time=datetime(2020,7,12,11,15), end_time=datetime(2020,7,12,11,45))
+        ApplicationFactory(applicant=ApplicantFactory(), job=self.job1,
+            interview_slot=interview_slot4)
+        interview_slot4.interviewers.add(self.interviewer1)
+        BusyTimeFactory(interviewer=self.interviewer2, begin=datetime(2020,7,12,12,0),
+            end=datetime(2020,7,12,12,15))
+        problem = Problem.from_database()
+        # interviewer1 needs travel time to and from the interview in room2
+        self.assertEqual(get_interviewer_availability(problem, travel_time=30).tolist(),
+            [[True, False, False], [True, True, False]])
+
+
+class BipsMatchingPriorityTest(TestCase):
+    def setUp(self):
+        self.interviewer1 = InterviewerFactory()
+        self.interviewer2 = InterviewerFactory()
+        self.interviewer3 = InterviewerFactory()
+        self.job1 = JobFactory()
+        self.job1.possible_interviewers_1.add(self.interviewer1)
+        self.job1.possible_interviewers_2.add(self.interviewer2, self.interviewer3,
+            InterviewerFactory())
+        # Two slots at the same time, so only one of them can have the priority 1 interviewer
+        self.interview_slot1 = InterviewSlotFactory(room=RoomFactory(),
+            start_time=datetime(2020,7,12,10,0), end_time=datetime(2020,7,12,10,30))
+        self.interview_slot2 = InterviewSlotFactory(room=RoomFactory(),
+            start_time=datetime(2020,7,12,10,0), end_time=datetime(2020,7,12,10,30))
+        self.interview_slot3 = InterviewSlotFactory(room=self.interview_slot2.room,
+            start_time=datetime(2020,7,12,14,0), end_time=datetime(2020,7,12,14,30))
+        for _ in range(2):
+            ApplicationFactory(applicant=ApplicantFactory(), job=self.job1)
+
+    def test_matched_slots_keep_their_priority_level(self):
+        scheduler = MatchingScheduler()
+        scheduler.schedule_interviews()
+        self.assertEqual(len(scheduler.interviews), 2)
+        self.assertEqual(count_interviews_without_priority_1(scheduler.interviews,
+            scheduler.applied_jobs, scheduler.job_pools), 0)
+        self.assertIn(self.interview_slot3,
+            [interview.interview_slot for interview in scheduler.interview_list])
+
+
+class BipsFailedProbeCacheTest(TestCase):
+    def setUp(self):
+        self.interviewer1 = InterviewerFactory()
+        self.interviewer2 = InterviewerFactory()
+        self.job1 = JobFactory()
+        self.job1.possible_interviewers_1.add(self.interviewer1, self.interviewer2)
+        self.room1 = RoomFactory()
+        self.room2 = RoomFactory()
+        self.interview_slot1 = InterviewSlotFactory(room=self.room1,
+            start_time=datetime(2020,7,12,10,0), end_time=datetime(2020,7,12,10,30))
+        self.interview_slot2 = InterviewSlotFactory(room=self.room2,
+            start_time=datetime(2020,7,12,10,0), end_time=datetime(2020,7,12,10,30))
+        self.interview_slot3 = InterviewSlotFactory(room=self.room1,
+            start_time=datetime(2020,7,15,10,0), end_time=datetime(2020,7,15,10,30))
+        self.applicant1 = ApplicantFactory()
+        self.applicant2 = ApplicantFactory()
+        self.applicant3 = ApplicantFactory()
+        for applicant in (self.applicant1, self.applicant2, self.applicant3):
+            ApplicationFactory(applicant=applicant, job=self.job1)
+        # applicant2 can only be interviewed in interview_slot2
+        BusyTimeFactory(applicant=self.applicant2, begin=datetime(2020,7,15,9,0),
+            end=datetime(2020,7,15,11,0))
+
+    def test_failed_probe_cache(self):
+        scheduler = Scheduler()
+        interviewers = {self.interviewer1, self.interviewer2}
+        add_interview(scheduler, self.applicant1, interviewers, self.interview_slot1)
+        add_interview(scheduler, self.applicant3, interviewers, self.interview_slot3)
+        applicant2 = applicant_id(scheduler, self.applicant2)
+        self.assertFalse(scheduler.create_interview(applicant2, 3))
+        # A failure at priority level 3 also holds for level 1
+        self.assertFalse(scheduler.create_interview(applicant2, 1))
+        self.assertEqual(scheduler.stats.failed_probe_cache_hits, 1)
+        # Releasing the interviewers days later does not change the result
+        scheduler.remove_interview(1)
+        self.assertFalse(scheduler.create_interview(applicant2, 1))
+        self.assertEqual(scheduler.stats.failed_probe_cache_hits, 2)
+        # Releasing them at the same time does
+        scheduler.remove_interview(0)
+        self.assertTrue(scheduler.create_interview(applicant2, 1))
+        self.assertEqual(scheduler.stats.failed_probe_cache_hits, 2)
+
+
+    def test_release_reaches_long_slots_on_the_day_before(self):
+        # A slot from the evening before, overlapping an interview early in the morning that
+        # starts more than the default work, travel and break time after midnight
+        long_slot = InterviewSlotFactory(room=self.room2, start_time=datetime(2020,7,14,23,0),
+            end_time=datetime(2020,7,15,5,45))
+        early_slot = InterviewSlotFactory(room=self.room1, start_time=datetime(2020,7,15,5,30),
+            end_time=datetime(2020,7,15,6,0))
+        scheduler = Scheduler()
+        # Long enough for the slot
+        scheduler.max_continuous_work = 8 * 60
+        add_interview(scheduler, self.applicant1, {self.interviewer1, self.interviewer2},
+            early_slot)
+        long_slot_id = scheduler.problem.slot_pks.tolist().index(long_slot.id)
+        scheduler.slot_is_free[:] = False
+        scheduler.slot_is_free[long_slot_id] = True
+        applicant3 = applicant_id(scheduler, self.applicant3)
+        self.assertFalse(scheduler.create_interview(applicant3, 3))
+        scheduler.remove_interview(0)
+        scheduler.slot_is_free[:] = False
+        scheduler.slot_is_free[long_slot_id] = True
+        self.assertTrue(scheduler.create_interview(applicant3, 3))
+        self.assertEqual(scheduler.interviews[0].interview_slot, long_slot_id)
+
+class BipsAvailableInterviewersTest(TestCase):
+    def setUp(self):
+        self.interviewer1 = InterviewerFactory()
+        self.interviewer2 = InterviewerFactory()
+        self.job1 = JobFactory()
+        self.job1.possible_interviewers_1.add(self.interviewer1, self.interviewer2)
+        self.applicant1 = ApplicantFactory()
+        ApplicationFactory(applicant=self.applicant1, job=self.job1)
+        self.room1 = RoomFactory()
+        self.room2 = RoomFactory()
+        self.interview_slots = [InterviewSlotFactory(room=room, start_time=start_time,
+            end_time=start_time + timedelta(minutes=45)) for room in (self.room1, self.room2)
+            for start_time in (datetime(2020,7,12,10,0), datetime(2020,7,12,10,45),
+            datetime(2020,7,12,14,0))]
+        BusyTimeFactory(interviewer=self.interviewer2, begin=datetime(2020,7,12,14,30),
+            end=datetime(2020,7,12,15,0))
+
+    def assertAvailability(self, scheduler, expected):
+        # expected gives the available interviewers of each slot, as model instances
+        problem = scheduler.problem
+        for interview_slot, interviewers in zip(self.interview_slots, expected):
+            slot = problem.slot_pks.tolist().index(interview_slot.id)
+            for interviewer in (self.interviewer1, self.interviewer2):
+                i = problem.interviewer_pks.tolist().index(interviewer.id)
+                self.assertEqual(scheduler.interviewer_can_take(i, slot),
+                    interviewer in interviewers)
+
+    def test_available_interviewers(self):
+        scheduler = Scheduler()
+        both = {self.interviewer1, self.interviewer2}
+        self.assertAvailability(scheduler, [both, both, {self.interviewer1}] * 2)
+        add_interview(scheduler, self.applicant1, both, self.interview_slots[0])
+        # Without travel time, the next slot can only be taken in the same room
+        self.assertAvailability(scheduler, [set(), both, {self.interviewer1}, set(), set(),
+            {self.interviewer1}])
+        scheduler.remove_interview(0)
+        self.assertAvailability(scheduler, [both, both, {self.interviewer1}] * 2)
+
+
+class BipsImproveTest(TestCase):
+    def setUp(self):
+        self.interviewer1 = InterviewerFactory()
+        self.interviewer2 = InterviewerFactory()
+        self.interviewer3 = InterviewerFactory()
+        self.job1 = JobFactory()
+        self.job1.possible_interviewers_1.add(self.interviewer1)
+        self.job1.possible_interviewers_2.add(self.interviewer2, self.interviewer3)
+        self.applicant1 = ApplicantFactory()
+        self.applicant2 = ApplicantFactory()
+        ApplicationFactory(applicant=self.applicant1, job=self.job1)
+        ApplicationFactory(applicant=self.applicant2, job=self.job1)
+        self.room1 = RoomFactory()
+        self.interview_slot1 = InterviewSlotFactory(room=self.room1,
+            start_time=datetime(2020,7,12,10,0), end_time=datetime(2020,7,12,10,30))
+        self.interview_slot2 = InterviewSlotFactory(room=self.room1,
+            start_time=datetime(2020,7,12,12,0), end_time=datetime(2020,7,12,12,30))
+
+    def test_improve(self):
+        scheduler = Scheduler()
+        interviewers = {self.interviewer2, self.interviewer3}
+        add_interview(scheduler, self.applicant1, interviewers, self.interview_slot1)
+        add_interview(scheduler, self.applicant2, interviewers, self.interview_slot2)
+        scheduler.improve(60)
+        # Both interviews get the priority 1 interviewer, and the search stops by itself
+        self.assertLess(scheduler.stats.phase_seconds["improve"], 60)
+        self.assertEqual(count_interviews_without_priority_1(scheduler.interviews,
+            scheduler.applied_jobs, scheduler.job_pools), 0)
+        self.assertLess(scheduler.stats.improve_cost_after, scheduler.stats.improve_cost_before)
+        self.assertEqual(Improver(scheduler).cost(), scheduler.stats.improve_cost_after)
+        self.assertEqual(scheduler.find_violations(), [])
+        # The interviewers are busy exactly at the slots of their interviews
+        busy_times = {}
+        for interview in scheduler.interviews:
+            slot = interview.interview_slot
+            for interviewer in interview.interviewers:
+                busy_times.setdefault(interviewer, set()).add(
+                    (scheduler.slot_start[slot], scheduler.slot_end[slot],
+                    scheduler.slot_room[slot]))
+        self.assertEqual({interviewer: set(busy_time_space) for interviewer, busy_time_space
+            in scheduler.interviewer_busy_time_space.items() if len(busy_time_space)},
+            busy_times)
+        self.assertEqual(scheduler.slot_interview,
+            {interview.interview_slot: interview for interview in scheduler.interviews})
+        self.assertEqual(scheduler.slot_index, {interview.interview_slot: index
+            for index, interview in enumerate(scheduler.interviews)})
+
+    def test_interviews_only_move_to_earlier_slots(self):
+        interview_slot3 = InterviewSlotFactory(room=self.room1,
+            start_time=datetime(2020,7,12,16,0), end_time=datetime(2020,7,12,16,30))
+        scheduler = Scheduler()
+        add_interview(scheduler, self.applicant1, {self.interviewer1, self.interviewer2},
+            self.interview_slot2)
+        slot_ids = scheduler.problem.slot_pks.tolist()
+        improver = Improver(scheduler)
+        interview = scheduler.interviews[0]
+        self.assertFalse(improver.move_interview(interview, slot_ids.index(interview_slot3.id)))
+        self.assertTrue(improver.move_interview(interview,
+            slot_ids.index(self.interview_slot1.id)))
+        self.assertEqual(scheduler.slot_interview, {slot_ids.index(self.interview_slot1.id):
+            interview})
+
+
+class BipsIncrementalSchedulingTest(TestCase):
+    def setUp(self):
+        self.interviewer1 = InterviewerFactory()
+        self.interviewer2 = InterviewerFactory()
+        self.interviewer3 = InterviewerFactory()
+        self.job1 = JobFactory()
+        self.job1.possible_interviewers_1.add(self.interviewer1)
+        self.job1.possible_interviewers_2.add(self.interviewer2)
+        self.job2 = JobFactory()
+        self.job2.possible_interviewers_1.add(self.interviewer1, self.interviewer3)
+        BusyTimeFactory(interviewer=self.interviewer3, begin=datetime(2020,7,12,8,0),
+            end=datetime(2020,7,12,9,0))
+        # An interview saved by an earlier run
+        self.room1 = RoomFactory()
+        self.saved_interview_slot = InterviewSlotFactory(room=self.room1,
+            start_time=datetime(2020,7,12,10,0), end_time=datetime(2020,7,12,10,30))
+        self.saved_interview_slot.interviewers.add(self.interviewer1, self.interviewer3)
+        self.applicant1 = ApplicantFactory()
+        ApplicationFactory(applicant=self.applicant1, job=self.job2,
+            interview_slot=self.saved_interview_slot)
+        # Late applications
+        self.application1 = ApplicationFactory(applicant=self.applicant1, job=self.job1)
+        self.applicant2 = ApplicantFactory()
+        self.application2 = ApplicationFactory(applicant=self.applicant2, job=self.job1)
+        self.room2 = RoomFactory()
+        self.interview_slot1 = InterviewSlotFactory(room=self.room2,
+            start_time=datetime(2020,7,12,10,0), end_time=datetime(2020,7,12,10,30))
+        self.interview_slot2 = InterviewSlotFactory(room=self.room2,
+            start_time=datetime(2020,7,12,11,0), end_time=datetime(2020,7,12,11,30))
+        self.interview_slot3 = InterviewSlotFactory(room=self.room2,
+            start_time=datetime(2020,7,12,12,0), end_time=datetime(2020,7,12,12,30))
+
+    def test_from_database_incremental(self):
+        problem = Problem.from_database(incremental=True)
+        self.assertEqual(problem.job_pks.tolist(), [self.job1.id])
+        self.assertEqual(problem.interviewer_pks.tolist(),
+            [self.interviewer1.id, self.interviewer2.id])
+        self.assertEqual(problem.applicant_pks.tolist(), [self.applicant1.id, self.applicant2.id])
+        self.assertEqual(problem.slot_pks.tolist(), [self.interview_slot1.id,
+            self.interview_slot2.id, self.interview_slot3.id])
+        # The saved interview makes both applicant1 and interviewer1 busy
+        self.assertEqual(problem.applicant_busy_applicant.tolist(), [0])
+        self.assertEqual(problem.applicant_busy_start.tolist(), [minutes(2020,7,12,10,0)])
+        self.assertEqual(problem.interviewer_busy_interviewer.tolist(), [0])
+        self.assertEqual(problem.interviewer_busy_room.tolist(),
+            [problem.room_pks.tolist().index(self.room1.id)])
+
+    def test_incremental_scheduling(self):
+        scheduler = Scheduler(incremental=True)
+        scheduler.schedule_interviews()
+        scheduler.save_scheduled_interviews()
+        self.application1.refresh_from_db()
+        self.application2.refresh_from_db()
+        self.assertEqual({self.application1.interview_slot, self.application2.interview_slot},
+            {self.interview_slot2, self.interview_slot3})
+        self.assertEqual(set(self.saved_interview_slot.interviewers.all()),
+            {self.interviewer1, self.interviewer3})
+
+
+class BipsBenchmarkTest(TestCase):
+    def test_generate_problem(self):
+        problem = generate_problem(30, days=2, seed=1)
+        self.assertEqual(problem["slots"], InterviewSlot.objects.count())
+        self.assertGreaterEqual(problem["slots"], 30 * 1.2)
+        self.assertEqual(Applicant.objects.count(), 30)
+        self.assertEqual(problem["applications"], Application.objects.count())
+
+    def test_fractional_busy_times(self):
+        problem = generate_problem(30, days=2, applicant_busy_times=0.25,
+            interviewer_busy_times=0)
+        self.assertEqual(problem["busy_times"], BusyTime.objects.count())
+        self.assertFalse(BusyTime.objects.filter(interviewer__isnull=False).exists())
+        self.assertLess(problem["busy_times"], 30)
+
+    def test_run_benchmark(self):
+        generate_problem(30, days=2)
+        result = run_benchmark()
+        self.assertEqual(list(result["phases"]), list(PHASES))
+        self.assertEqual(result["phases"]["pass_1"]["queries"], 0)
+        self.assertEqual(len(get_applications()), 30 - result["allocated"])
+
+
+class ProblemSnapshotTest(TestCase):
+    def setUp(self):
+        generate_problem(30, days=2, seed=1)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'problem.npz')
+
+    def test_save_and_load(self):
+        problem = Problem.from_database()
+        problem.save(self.path)
+        # Memory-map every non-empty array
+        loaded = Problem.load(self.path, mmap_bytes=0)
+        self.assertIsInstance(loaded.interviewer_busy_start, np.memmap)
+        for field in Problem.__slots__:
+            value = getattr(problem, field)
+            if isinstance(value, np.ndarray):
+                self.assertEqual(getattr(loaded, field).dtype, value.dtype, field)
+                self.assertEqual(getattr(loaded, field).tolist(), value.tolist(), field)
+            else:
+                self.assertEqual(getattr(loaded, field), value, field)
+
+    def test_scheduler_from_snapshot(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            call_command('dump_problem', self.path)
+        scheduler = Scheduler.from_snapshot(self.path, seed=3)
+        scheduler.schedule_interviews()
+        expected = Scheduler(seed=3)
+        expected.schedule_interviews()
+        self.assertEqual(scheduler.interview_list, expected.interview_list)
+        scheduler.save_scheduled_interviews()
+        self.assertEqual(len(get_applications()), len(scheduler.unallocated_applicants))
+
+    def test_stale_snapshot(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            call_command('dump_problem', self.path)
+        # The interviews are saved after the snapshot was dumped
+        scheduler = Scheduler(seed=3)
+        scheduler.schedule_interviews()
+        scheduler.save_scheduled_interviews()
+        SlotInterviewer = InterviewSlot.interviewers.through
+        saved = (list(Application.objects.order_by('id').values_list('id', 'interview_slot')),
+            SlotInterviewer.objects.count())
+        with contextlib.redirect_stdout(io.StringIO()), mock.patch('builtins.input',
+            return_value="y"), self.assertRaisesMessage(CommandError, "out of date"):
+            call_command('schedule_interviews', '--snapshot', self.path)
+        self.assertEqual(saved,
+            (list(Application.objects.order_by('id').values_list('id', 'interview_slot')),
+            SlotInterviewer.objects.count()))
+
+    def test_save_from_snapshot(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            call_command('dump_problem', self.path)
+            with mock.patch('builtins.input', return_value="y"):
+                call_command('schedule_interviews', '--snapshot', self.path)
+        self.assertLess(len(get_applications()), 30)
+
+    def test_version_mismatch(self):
+        np.savez(self.path, snapshot_version=np.array(0))
+        with self.assertRaises(ValueError):
+            Problem.load(self.path)
+
+
+class SchedulePlanTest(TestCase):
+    def setUp(self):
+        generate_problem(30, days=2, seed=1)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'plan.json')
+        with contextlib.redirect_stdout(io.StringIO()), mock.patch('builtins.input',
+            side_effect=AssertionError("input() called")):
+            call_command('schedule_interviews', '--plan-out', self.path)
+        with open(self.path) as plan_file:
+            self.plan = json.load(plan_file)
+
+    def apply_plan(self, *args):
+        with open(self.path, 'w') as plan_file:
+            json.dump(self.plan, plan_file)
+        with contextlib.redirect_stdout(io.StringIO()):
+            call_command('apply_plan', self.path, *args)
+
+    def test_plan_out_and_apply(self):
+        # Planning doesn't write to the database
+        self.assertEqual(len(get_applications()), 30)
+        self.assertEqual(self.plan["summary"]["interviews"], len(self.plan["interviews"]))
+        self.assertEqual(self.plan["summary"]["unallocated_applicants"],
+            30 - len(self.plan["interviews"]))
+        self.apply_plan('--dry-run')
+        self.assertEqual(len(get_applications()), 30)
+        self.apply_plan()
+        self.assertEqual(len(get_applications()), 30 - len(self.plan["interviews"]))
+        for interview in self.plan["interviews"]:
+            interview_slot = InterviewSlot.objects.get(pk=interview["interview_slot"])
+            self.assertEqual(
+                sorted(interview_slot.application_set.values_list('id', flat=True)),
+                sorted(interview["applications"]))
+            self.assertEqual(
+                sorted(interview_slot.interviewers.values_list('id', flat=True)),
+                interview["interviewers"])
+
+    def test_stale_plan(self):
+        # An application scheduled since the plan was made
+        interview = self.plan["interviews"][0]
+        Application.objects.filter(pk=interview["applications"][0]).update(
+            interview_slot=interview["interview_slot"])
+        with self.assertRaisesMessage(CommandError, "no longer unscheduled"):
+            self.apply_plan()
+        self.assertEqual(len(get_applications()), 29)
+
+    def test_invalid_plan(self):
+        interview = self.plan["interviews"][0]
+        interview["interviewers"] = interview["interviewers"][:1]
+        with self.assertRaisesMessage(CommandError, "fewer than two interviewers"):
+            self.apply_plan()
+        self.assertEqual(len(get_applications()), 30)
+        self.plan["plan_version"] = 0
+        with self.assertRaisesMessage(CommandError, "not a schedule plan"):
+            self.apply_plan()
+
+
+class ImportApplicationsTest(TestCase):
+    def import_csv(self, text, *args):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as csvfile:
+            csvfile.write(text)
+        self.addCleanup(os.remove, csvfile.name)
+        with contextlib.redirect_stdout(io.StringIO()):
+            call_command('import_applications', csvfile.name, *args)
+
+    def test_import_applications(self):
+        JobFactory(title="Bartender")
+        self.import_csv("Time,Name,Email,Age,Phone,Study,Year,Jobs\n"
+            + "x,Ola,ola@example.com,20,123,x,1,\"Bartender, Cook\"\n"
+            + "x,Kari,kari@example.com,21,456,x,2,Cook\n"
+            + "x,Per,per@example.com,22,789,x,3,\"Cook,Cook\"\n", '--batch-size', '2')
+        self.assertEqual(Job.objects.count(), 2)
+        self.assertEqual(Applicant.objects.get(name="Kari").phone, "456")
+        self.assertCountEqual(Application.objects.values_list('applicant__name', 'job__title'),
+            [("Ola", "Bartender"), ("Ola", "Cook"), ("Kari", "Cook"), ("Per", "Cook")])
+
+    def test_import_without_bulk_insert_returning(self):
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert',
+            new_callable=mock.PropertyMock, return_value=False):
+            self.import_csv("Name,Jobs\nOla,Cook\nKari,\"Cook, Bartender\"\n",
+                '--name-column', 'Name', '--email-column', 'Name', '--phone-column', 'Name',
+                '--jobs-column', 'Jobs', '--batch-size', '1')
+        self.assertCountEqual(Application.objects.values_list('applicant__name', 'job__title'),
+            [("Ola", "Cook"), ("Kari", "Cook"), ("Kari", "Bartender")])
+
+    def test_column_mapping(self):
+        self.import_csv("Jobs;x;Name\nCook;x;Ola\n", '--delimiter', ';', '--jobs-column', 'Jobs',
+            '--name-column', '2', '--email-column', 'x', '--phone-column', 'x')
+        self.assertEqual(Application.objects.get().applicant.name, "Ola")
+        with self.assertRaises(CommandError):
+            self.import_csv("Jobs,Name\nCook,Ola\n", '--jobs-column', 'Job')
+        with self.assertRaises(CommandError):
+            self.import_csv("Jobs,Name\nCook,Ola\n", '--jobs-column', '0')
+        self.assertEqual(Applicant.objects.count(), 1)
+
+
+class GenerateSlotsTest(TestCase):
+    def generate_slots(self, *args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            call_command('generate_slots', '--first-date', '2022-02-01', '--last-date',
+                '2022-02-02', *args)
+
+    def test_generate_slots(self):
+        room1 = RoomFactory(name="Room 1")
+        self.generate_slots('--first-time', '09:00', '--last-time', '10:30',
+            '--gap-minutes', '15', '--rooms', 'Room 1', 'Digital', 'Digital')
+        self.assertEqual(Room.objects.filter(name="Digital").count(), 2)
+        self.assertEqual(InterviewSlot.objects.count(), 3 * 2 * 2)
+        self.assertEqual(list(InterviewSlot.objects.filter(room=room1,
+            start_time__date=datetime(2022,2,2)).values_list('start_time', 'end_time')),
+            [(datetime(2022,2,2,9,0), datetime(2022,2,2,9,45)),
+            (datetime(2022,2,2,10,0), datetime(2022,2,2,10,45))])
+        assert_one_interview_slot_per_room_per_time()
+
+    def test_rooms_without_bulk_insert_returning(self):
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert',
+            new_callable=mock.PropertyMock, return_value=False):
+            self.generate_slots('--last-time', '10:00', '--rooms', 'Room 1', 'Room 2', 'Room 2')
+        self.assertEqual(sorted(Room.objects.values_list('name', flat=True)),
+            ["Room 1", "Room 2", "Room 2"])
+        self.assertEqual(InterviewSlot.objects.count(), 3 * 2 * 2)
+
+    def test_overlaps_are_rejected(self):
+        self.generate_slots('--first-time', '09:00', '--last-time', '10:00', '--rooms', 'Room 1')
+        with self.assertRaises(CommandError):
+            self.generate_slots('--first-time', '10:00', '--rooms', 'Room 2', 'Room 1')
+        # Slots running past midnight overlap the first slot of the next day
+        with self.assertRaises(CommandError):
+            self.generate_slots('--first-time', '00:00', '--last-time', '23:59',
+                '--slot-minutes', '50', '--rooms', 'Room 3')
+        self.assertEqual(Room.objects.count(), 1)
+        self.assertEqual(InterviewSlot.objects.count(), 4)
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        self.output = os.path.join(tempfile.mkdtemp(), 'interviews')
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.output))
+        job1 = JobFactory(title="Bartender")
+        job2 = JobFactory(title="Cook")
+        for i, room_name in enumerate(("B", "A", "C")):
+            interview_slot = InterviewSlotFactory(room=RoomFactory(name=room_name),
+                start_time=datetime(2022,2,1,10+i,0), end_time=datetime(2022,2,1,10+i,45))
+            interview_slot.interviewers.add(InterviewerFactory(name=f"Interviewer {i}"),
+                InterviewerFactory(name=f"Interviewer {i + 3}"))
+            applicant = ApplicantFactory(name=f"Applicant {2 - i}", email=f"{i}@example.com")
+            ApplicationFactory(applicant=applicant, job=job1, interview_slot=interview_slot)
+            if i == 0:
+                ApplicationFactory(applicant=applicant, job=job2, interview_slot=interview_slot)
+        ApplicationFactory(applicant=ApplicantFactory(), job=job1)
+
+    def export(self, *args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            call_command('export_csv', '--output', self.output, *args)
+        with open(self.output, encoding='utf-8') as outfile:
+            return outfile.read().splitlines()
+
+    def test_export_csv(self):
+        # One query for the slots, and one each for the interviewers and applications of each
+        # chunk of slots
+        with self.assertNumQueries(3):
+            lines = self.export()
+        self.assertEqual(list(csv.reader(lines[:2])), [
+            ["Applicant name", "Applicant email", "Start time", "End time", "Room",
+                "Interviewers", "Applied jobs"],
+            ["Applicant 2", "0@example.com", "2022-02-01 10:00:00", "2022-02-01 10:45:00", "B",
+                "Interviewer 0, Interviewer 3", "Bartender, Cook"]])
+        self.assertEqual(len(lines), 4)
+        with self.assertNumQueries(5):
+            self.export('--chunk-size', '2')
+
+    def test_export_jsonl(self):
+        lines = self.export('--format', 'jsonl', '--order-by', 'room')
+        self.assertEqual(json.loads(lines[0]), {"applicant_name": "Applicant 1",
+            "applicant_email": "1@example.com", "start_time": "2022-02-01T11:00:00",
+            "end_time": "2022-02-01T11:45:00", "room": "A",
+            "interviewers": ["Interviewer 1", "Interviewer 4"], "applied_jobs": ["Bartender"]})
+        lines = self.export('--format', 'jsonl', '--order-by', 'applicant')
+        self.assertEqual([json.loads(line)["applicant_name"] for line in lines],
+            ["Applicant 0", "Applicant 1", "Applicant 2"])
+
+
+class ExportCalendarsTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.interviewer1 = InterviewerFactory(name="Kari Nordmann")
+        self.interviewer2 = InterviewerFactory(name="Ola")
+        room = RoomFactory(name="Room 1")
+        job = JobFactory(title="Bartender, kitchen")
+        for i in range(2):
+            interview_slot = InterviewSlotFactory(room=room,
+                start_time=datetime(2022,2,1,10+i,0), end_time=datetime(2022,2,1,10+i,45))
+            interview_slot.interviewers.add(self.interviewer1,
+                *([self.interviewer2] if i == 0 else []))
+            ApplicationFactory(applicant=ApplicantFactory(name=f"Applicant {i}"), job=job,
+                interview_slot=interview_slot)
+
+    def export_calendars(self, *args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            call_command('export_calendars', *args)
+
+    def test_export_calendars(self):
+        with self.assertNumQueries(3):
+            self.export_calendars('--output-dir', self.directory)
+        self.assertCountEqual(os.listdir(self.directory), [
+            f"interviewer-{self.interviewer1.id}-kari-nordmann.ics",
+            f"interviewer-{self.interviewer2.id}-ola.ics",
+            f"room-{Room.objects.get().id}-room-1.ics"])
+        with open(os.path.join(self.directory,
+            f"interviewer-{self.interviewer1.id}-kari-nordmann.ics"), newline='') as icsfile:
+            calendar = icsfile.read()
+        self.assertTrue(calendar.startswith("BEGIN:VCALENDAR\r\n"))
+        self.assertTrue(calendar.endswith("END:VCALENDAR\r\n"))
+        self.assertEqual(calendar.count("BEGIN:VEVENT"), 2)
+        self.assertIn("DTSTART:20220201T110000\r\n", calendar)
+        self.assertIn("SUMMARY:Interview with Applicant 0\r\n", calendar)
+        # Long lines are folded, and commas and newlines in text are escaped
+        self.assertTrue(all(len(line.encode()) <= 75 for line in calendar.split("\r\n")))
+        self.assertIn("DESCRIPTION:Applied jobs: Bartender\\, kitchen\\nInterviewers: Kari "
+            + "Nordmann\\, Ola\\nApplicant email: ", calendar.replace("\r\n ", ""))
+
+    def test_events_formatted_by_workers(self):
+        # With one interview per task, the events are still in order of start time
+        with mock.patch('scheduler.management.commands.export_calendars.EVENTS_PER_TASK', 1):
+            self.export_calendars('--output-dir', self.directory, '--workers', '2')
+        with open(os.path.join(self.directory,
+            f"interviewer-{self.interviewer1.id}-kari-nordmann.ics"), newline='') as icsfile:
+            calendar = icsfile.read()
+        self.assertLess(calendar.index("Interview with Applicant 0"),
+            calendar.index("Interview with Applicant 1"))
+
+    def test_export_calendars_to_zip(self):
+        archive_name = os.path.join(self.directory, 'calendars.zip')
+        self.export_calendars('--zip', archive_name, '--calendars', 'rooms')
+        with zipfile.ZipFile(archive_name) as archive:
+            self.assertEqual(archive.namelist(), [f"room-{Room.objects.get().id}-room-1.ics"])
+
+
+class BusyTimeIndexTest(SimpleTestCase):
+    def setUp(self):
+        self.busy_times = BusyTimeIndex({
+            (minutes(2020,6,21,8), minutes(2020,6,21,16), None),
+            (minutes(2020,6,22,10), minutes(2020,6,22,10,30), 1),
+        })
+
+    def test_overlapping_long_busy_time(self):
+        self.assertEqual(list(self.busy_times.overlapping(minutes(2020,6,21,15),
+            minutes(2020,6,21,17))), [(minutes(2020,6,21,8), minutes(2020,6,21,16), None)])
+
+    def test_padding_for_travel_time(self):
+        travel_time = 30
+        start, end = minutes(2020,6,22,11), minutes(2020,6,22,11,30)
+        self.assertEqual(list(self.busy_times.overlapping(start, end)), [])
+        self.assertEqual(list(self.busy_times.overlapping(start, end, travel_time)),
+            [(minutes(2020,6,22,10), minutes(2020,6,22,10,30), 1)])
+
+    def test_remove(self):
+        self.busy_times.remove((minutes(2020,6,21,8), minutes(2020,6,21,16), None))
+        self.assertEqual(list(self.busy_times.overlapping(minutes(2020,6,21,15),
+            minutes(2020,6,21,17))), [])
+        self.assertEqual(len(self.busy_times), 1)
+
+    def test_long_busy_time_doesnt_widen_queries(self):
+        # A month long busy time and interviews every hour after it
+        first = minutes(2020,7,1,0)
+        busy_times = BusyTimeIndex([(first, first + 30 * 24 * 60, None)]
+            + [(first + 60 * i, first + 60 * i + 45, 1) for i in range(1000)])
+        # Only the busy times near the queried interval are looked at
+        start = first + 60 * 500 + 10
+        self.assertCountEqual(busy_times.overlapping(start, start + 5),
+            [(first, first + 30 * 24 * 60, None), (first + 60 * 500, first + 60 * 500 + 45, 1)])
+        busy_times.remove((first, first + 30 * 24 * 60, None))
+        self.assertEqual(len(busy_times), 1000)
+        self.assertEqual(list(busy_times)[:2],
+            [(first, first + 45, 1), (first + 60, first + 105, 1)])
+
+
+class WorkRunsTest(SimpleTestCase):
+    def setUp(self):
+        break_length = 20
+        self.work_runs = WorkRuns(break_length, [
+            (minutes(2020,6,21,10), minutes(2020,6,21,11)),
+            (minutes(2020,6,21,11,10), minutes(2020,6,21,12)),
+            (minutes(2020,6,21,13), minutes(2020,6,21,14)),
+        ])
+
+    def test_interviews_merged_into_runs(self):
+        self.assertEqual(list(self.work_runs), [
+            (minutes(2020,6,21,10), minutes(2020,6,21,12)),
+            (minutes(2020,6,21,13), minutes(2020,6,21,14))])
+
+    def test_continuous_work_with_joins_neighbouring_runs(self):
+        self.assertEqual(self.work_runs.continuous_work_with(
+            minutes(2020,6,21,12,10), minutes(2020,6,21,12,50)),
+            minutes(2020,6,21,14) - minutes(2020,6,21,10))
+        self.assertEqual(self.work_runs.continuous_work_with(
+            minutes(2020,6,21,15), minutes(2020,6,21,16)),
+            minutes(2020,6,21,16) - minutes(2020,6,21,15))
+
+    def test_remove_splits_run(self):
+        self.work_runs.add(minutes(2020,6,21,12,10), minutes(2020,6,21,12,50))
+        self.assertEqual(len(list(self.work_runs)), 1)
+        self.work_runs.remove(minutes(2020,6,21,11,10), minutes(2020,6,21,12))
+        self.assertEqual(list(self.work_runs), [
+            (minutes(2020,6,21,10), minutes(2020,6,21,11)),
+            (minutes(2020,6,21,12,10), minutes(2020,6,21,14))])
+
+
+class InterviewerViolationsTest(SimpleTestCase):
+    def setUp(self):
+        # Three 60 minute slots, at 0 in room 0, at 60 in room 1 and at 120 in room 1
+        self.problem = Problem()
+        self.problem.slot_start = np.array([0, 60, 120])
+        self.problem.slot_end = np.array([60, 120, 180])
+        self.problem.slot_room = np.array([0, 1, 1], dtype=np.int32)
+
+    def find_violations(self, interviews, busy_times=()):
+        self.problem.set_interviewer_busy_times(list(busy_times))
+        return find_interviewer_violations(self.problem, interviews, travel_time=30,
+            max_continuous_work=150, break_length=20)
+
+    def test_no_violations(self):
+        self.assertEqual(self.find_violations([Interview(0, {0, 1}, 1),
+            Interview(1, {0}, 2)], [(0, 200, 260, -1), (1, 0, 30, 0)]), [])
+        self.assertEqual(self.find_violations([]), [])
+
+    def test_overlaps(self):
+        # A busy time starting during an interview, and interviews starting during a busy time
+        # and during another interview
+        self.assertCountEqual(self.find_violations([Interview(0, {0}, 0),
+            Interview(1, {1}, 2)], [(0, 30, 40, -1), (1, 100, 130, -1)]), [
+            Violation("interviewer_busy", interviewer=0, interview_slot=0),
+            Violation("interviewer_busy", interviewer=1, interview_slot=2)])
+        self.problem.slot_room[1] = 0
+        self.problem.slot_start[1] = 30
+        self.assertEqual(self.find_violations([Interview(0, {0}, 0), Interview(1, {0}, 1)]),
+            [Violation("interviewer_taken_twice", interviewer=0, interview_slot=1)])
+
+    def test_travel_time(self):
+        # Existing interviews are only checked against scheduled ones
+        self.assertEqual(self.find_violations([Interview(0, {0}, 2)],
+            [(0, 0, 60, 0), (0, 60, 90, 2), (0, 200, 230, 0)]), [
+            Violation("insufficient_travel_time", interviewer=0, interview_slot=2)])
+
+    def test_breaks(self):
+        self.assertEqual(self.find_violations([Interview(0, {0}, 0), Interview(1, {0}, 1),
+            Interview(2, {0}, 2)]), [
+            Violation("insufficient_travel_time", interviewer=0, interview_slot=1),
+            Violation("insufficient_breaks", interviewer=0, interview_slot=2)])
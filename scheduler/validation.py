@@ -0,0 +1,200 @@
+# BIPS: Validating scheduled interviews
+# Checks a list of Interview objects with ids against the Problem they were scheduled from,
+# without querying the database, and reports every broken rule as a Violation.
+
+import numpy as np
+
+# Longer than any time in minutes, see find_interviewer_violations
+TIME_LINE_SPAN = 2**32
+
+# The rules checked by find_violations, with a description of how each is broken
+RULES = {
+    "too_few_interviewers": "The interview has fewer than two interviewers",
+    "job_not_represented": "No interviewer is from the pool of an applied job",
+    "priority_1_missing": "No priority 1 interviewer for a job that requires one",
+    "applicant_busy": "The applicant is busy at the time of the interview",
+    "interviewer_busy": "The interviewer is busy at the time of the interview",
+    "slot_taken_twice": "The interview slot is used by more than one interview",
+    "interviewer_taken_twice": "The interviewer has overlapping interviews",
+    "applicant_taken_twice": "The applicant has more than one interview",
+    "insufficient_travel_time": "The interviewer has too little time to change rooms",
+    "insufficient_breaks": "The interviewer works too long without a break",
+}
+
+
+class Violation:
+    """
+    A broken rule, with the ids of the applicant, interviewer and interview slot involved
+    (None where the rule does not concern one).
+    """
+
+    __slots__ = ('rule', 'applicant', 'interviewer', 'interview_slot')
+
+    def __init__(self, rule, applicant=None, interviewer=None, interview_slot=None):
+        self.rule = rule
+        self.applicant = applicant
+        self.interviewer = interviewer
+        self.interview_slot = interview_slot
+
+    def __eq__(self, other):
+        return (isinstance(other, Violation) and
+            self.rule == other.rule and
+            self.applicant == other.applicant and
+            self.interviewer == other.interviewer and
+            self.interview_slot == other.interview_slot)
+
+    def __repr__(self):
+        return (f"Violation({self.rule!r}, applicant={self.applicant}, "
+            + f"interviewer={self.interviewer}, interview_slot={self.interview_slot})")
+
+    def describe(self, problem):
+        # A readable description, with database primary keys
+        description = RULES[self.rule]
+        for name, pks, value in (("applicant", problem.applicant_pks, self.applicant),
+            ("interviewer", problem.interviewer_pks, self.interviewer),
+            ("interview slot", problem.slot_pks, self.interview_slot)):
+            if value is not None:
+                description += f", {name} {pks[value]}"
+        return description
+
+
+def find_violations(problem, interviews, travel_time, max_continuous_work, break_length,
+    job_pools=None):
+    """
+    Returns a list of Violations of the scheduling rules by interviews, in one pass over the
+    interviews and one pass over the sorted time line of each interviewer. Times are given in
+    minutes.
+    """
+    if job_pools is None:
+        job_pools = problem.interviewer_pools()
+    violations = []
+    slot_start = problem.slot_start.tolist()
+    slot_end = problem.slot_end.tolist()
+
+    # Applicant busy times, sorted by applicant so that each applicant's are a contiguous run
+    order = np.argsort(problem.applicant_busy_applicant, kind='stable')
+    busy_applicant = problem.applicant_busy_applicant[order]
+    busy_start = problem.applicant_busy_start[order].tolist()
+    busy_end = problem.applicant_busy_end[order].tolist()
+    interviewed = [interview.applicant for interview in interviews]
+    busy_first = np.searchsorted(busy_applicant, interviewed, side='left').tolist()
+    busy_last = np.searchsorted(busy_applicant, interviewed, side='right').tolist()
+
+    taken_slots = set()
+    taken_applicants = set()
+    for i, interview in enumerate(interviews):
+        applicant = interview.applicant
+        interviewers = interview.interviewers
+        slot = interview.interview_slot
+        start, end = slot_start[slot], slot_end[slot]
+        if len(interviewers) < 2:
+            violations.append(Violation("too_few_interviewers", applicant,
+                interview_slot=slot))
+        for job in problem.applicant_jobs[applicant]:
+            pool = job_pools[job]
+            if pool.all.isdisjoint(interviewers):
+                violations.append(Violation("job_not_represented", applicant,
+                    interview_slot=slot))
+            if problem.job_include_priority_1[job] and pool.priority_1.isdisjoint(interviewers):
+                violations.append(Violation("priority_1_missing", applicant,
+                    interview_slot=slot))
+        for busy in range(busy_first[i], busy_last[i]):
+            if busy_start[busy] < end and busy_end[busy] > start:
+                violations.append(Violation("applicant_busy", applicant, interview_slot=slot))
+                break
+        if slot in taken_slots:
+            violations.append(Violation("slot_taken_twice", applicant, interview_slot=slot))
+        taken_slots.add(slot)
+        if applicant in taken_applicants:
+            violations.append(Violation("applicant_taken_twice", applicant,
+                interview_slot=slot))
+        taken_applicants.add(applicant)
+
+    violations.extend(find_interviewer_violations(problem, interviews, travel_time,
+        max_continuous_work, break_length))
+    return violations
+
+
+def find_interviewer_violations(problem, interviews, travel_time, max_continuous_work,
+    break_length):
+    """
+    Returns the Violations of the rules for the time line of each interviewer: no overlapping
+    interviews or busy times, travel time between rooms and breaks. The scheduled interviews
+    and the busy times are packed into one row per interviewer and time, sorted once, and
+    checked with array operations.
+    """
+    if not interviews:
+        return []
+    slots = np.array([interview.interview_slot for interview in interviews
+        for _ in interview.interviewers], dtype=np.int64)
+    # Busy times from the database have slot -1, and those with a room are existing interviews
+    slot = np.concatenate((slots, np.full(len(problem.interviewer_busy_interviewer), -1)))
+    interviewer = np.concatenate((np.array([interviewer for interview in interviews
+        for interviewer in interview.interviewers], dtype=np.int64),
+        problem.interviewer_busy_interviewer))
+    start = np.concatenate((problem.slot_start[slots], problem.interviewer_busy_start))
+    end = np.concatenate((problem.slot_end[slots], problem.interviewer_busy_end))
+    room = np.concatenate((problem.slot_room[slots].astype(np.int64),
+        problem.interviewer_busy_room))
+    order = np.lexsort((slot, room, end, start, interviewer))
+    interviewer, start, end, room, slot = (interviewer[order], start[order], end[order],
+        room[order], slot[order])
+    scheduled = slot != -1
+    violations = []
+
+    # Times are offset by interviewer * TIME_LINE_SPAN, so that one running maximum over all
+    # rows never carries an end time from one interviewer's time line into the next one's
+    offset = interviewer * TIME_LINE_SPAN
+    start_key = offset + start
+    end_key = offset + end
+    scheduled_until, scheduled_row = latest_end_before(end_key, scheduled, offset)
+    busy_until, _ = latest_end_before(end_key, ~scheduled, offset)
+    for rows, rule in (
+        (scheduled & (start_key < scheduled_until), "interviewer_taken_twice"),
+        (scheduled & (start_key < busy_until), "interviewer_busy")):
+        violations.extend(Violation(rule, interviewer=i, interview_slot=s)
+            for i, s in zip(interviewer[rows].tolist(), slot[rows].tolist()))
+    # Busy times starting during a scheduled interview
+    rows = ~scheduled & (start_key < scheduled_until)
+    violations.extend(Violation("interviewer_busy", interviewer=i, interview_slot=s)
+        for i, s in zip(interviewer[rows].tolist(), slot[scheduled_row[rows]].tolist()))
+
+    # Travel time between consecutive interviews, scheduled or existing. Existing interviews
+    # were created manually, and are not checked against each other.
+    interview_rows = np.flatnonzero(room != -1)
+    first, second = interview_rows[:-1], interview_rows[1:]
+    rows = ((interviewer[first] == interviewer[second])
+        & (scheduled[first] | scheduled[second]) & (room[first] != room[second])
+        & (end[first] + travel_time > start[second]))
+    violations.extend(Violation("insufficient_travel_time", interviewer=i, interview_slot=s)
+        for i, s in zip(interviewer[second[rows]].tolist(),
+        np.where(scheduled[second[rows]], slot[second[rows]], slot[first[rows]]).tolist()))
+
+    # Continuous work in runs of scheduled interviews with less than break_length between
+    # them. A run starts with the length of its first interview, and each following interview
+    # adds the time from the end of the previous one.
+    scheduled_rows = np.flatnonzero(scheduled)
+    interviewer, start, end, slot = (interviewer[scheduled_rows], start[scheduled_rows],
+        end[scheduled_rows], slot[scheduled_rows])
+    previous_end = np.concatenate(([0], end[:-1]))
+    run_starts = np.ones(len(scheduled_rows), dtype=bool)
+    run_starts[1:] = ((interviewer[1:] != interviewer[:-1])
+        | (start[1:] >= previous_end[1:] + break_length))
+    work = np.where(run_starts, end - start, end - previous_end)
+    total_work = np.cumsum(work)
+    run_start = np.maximum.accumulate(np.where(run_starts, np.arange(len(scheduled_rows)), 0))
+    rows = total_work - total_work[run_start] + work[run_start] > max_continuous_work
+    violations.extend(Violation("insufficient_breaks", interviewer=i, interview_slot=s)
+        for i, s in zip(interviewer[rows].tolist(), slot[rows].tolist()))
+    return violations
+
+
+def latest_end_before(end_key, selected, offset):
+    # For each row, the latest end of the selected rows before it in the same time line (or
+    # the offset of the time line if there are none), and the row it belongs to
+    latest = np.concatenate(([-1],
+        np.maximum.accumulate(np.where(selected, end_key, offset))[:-1]))
+    # The rows that raise the running maximum, carried forward
+    latest_row = np.maximum.accumulate(np.where(selected & (end_key > latest),
+        np.arange(len(end_key)), 0))
+    return latest, np.concatenate(([0], latest_row[:-1]))